@@ -1,20 +1,76 @@
 import random
+import time
+from pathlib import Path
 
 from pystac_client import Client
 import planetary_computer as pc
 
-from helpers import download_items
-from config import BANDS, BBOX, MAX_CLOUD_COVER, PC_CATALOG, COLLECTIONS
+from helpers import download_items, download_stream, is_geotiff
+from manifest import Manifest
+from scene_selection import select_scenes
+from search_cache import cached_search, stream_search
+from telemetry import TransferLog
+from config import (
+    BANDS,
+    BBOX,
+    MAX_CLOUD_COVER,
+    PC_CATALOG,
+    COLLECTIONS,
+    DOWNLOAD_WORKERS,
+    MAX_REQUESTS_PER_HOST,
+    DOWNLOAD_RATE_LIMIT,
+    DOWNLOAD_MAX_ATTEMPTS,
+    DOWNLOAD_TIMEOUT,
+    SEARCH_CACHE_DIR,
+    SEARCH_CACHE_TTL,
+    SEARCH_QUEUE_SIZE,
+)
 
 TEST = True  # if True, limit downloads for testing
 DOWNLOAD = True
+WINDOWED = True  # if True, only read the COG tiles intersecting BBOX
+STREAM = True  # if True, download items while the catalog is still paging
+SELECT_SCENES = True  # if True, download only the granules needed to cover BBOX per date
 
 IMAGERY_DIR = "data"
+MANIFEST_PATH = Path(IMAGERY_DIR) / "manifest.sqlite"
 
 if TEST:
     BBOX = [-93.5, 45, -93.3, 45.2]  # Smaller bbox for testing
 
 
+def limit_per_collection(items, collections, n):
+    """Pass through the first ``n`` items of each collection, then stop."""
+    counts = {collection: 0 for collection in collections}
+    for item in items:
+        if counts.get(item.collection_id, n) < n:
+            counts[item.collection_id] += 1
+            yield item
+        if all(count >= n for count in counts.values()):
+            return
+
+
+def only_missing(items, manifest, bbox):
+    """Pass through the items with at least one asset the manifest lacks."""
+    for item in items:
+        if manifest.missing([item], BANDS, window=bbox, is_windowed=is_geotiff):
+            yield item
+        else:
+            print(f"  ⊘ {item.id} (all assets in manifest)")
+
+
+def print_download_summary(stats, telemetry):
+    print("\nDownload Summary:")
+    print("=" * 70)
+    for k, v in stats.items():
+        print(f"  {k.replace('_', ' ').title()}: {v}")
+    for phase, seconds in telemetry.summary()["phases_s"].items():
+        print(f"  {phase.title()} Time: {seconds} s")
+    report = telemetry.write(IMAGERY_DIR, stats)
+    print(f"  Telemetry report: {report}")
+    print("=" * 70)
+
+
 def main():
     """Main execution function."""
 
@@ -25,6 +81,7 @@ def main():
     print(f"  Area of Interest (bbox): {BBOX}")
     print(f"  Cloud cover threshold: <= {MAX_CLOUD_COVER}%")
     print(f"  Collections: {COLLECTIONS}")
+    print(f"  Windowed COG reads: {WINDOWED}")
     print(f"  Requested Landsat Harmonized Bands: {BANDS['hls2-l30']}")
     print(f"  Requested Sentinel-2 Harmonized Bands: {BANDS['hls2-s30']}")
     print(f"  Latitude: {BBOX[1]} to {BBOX[3]}")
@@ -39,8 +96,9 @@ def main():
 
         try:
             # Create client
-            catalog = Client.open(PC_CATALOG,
-                                modifier=pc.sign_inplace,)
+            # items are signed after the cache lookup, so cached results
+            # never carry expired tokens
+            catalog = Client.open(PC_CATALOG)
             print(f"  ✓ Connected to: {PC_CATALOG}\n")
         except Exception as e:
             print(f"  ✗ Failed to connect to Planetary Computer: {e}\n")
@@ -51,17 +109,52 @@ def main():
         # =========================================================================
         print("Searching for harmonized Sentinel-2/Landsat imagery...\n")
 
-        items = {collection: None for collection in COLLECTIONS}
-        for collection in COLLECTIONS:
-            print(f"  Querying {collection}...")
-            search_kwargs = {
-                    "collections": collection,
-                    "bbox": BBOX,
-                    "query": {"eo:cloud_cover": {"lte": MAX_CLOUD_COVER}}
-                }
+        telemetry = TransferLog()
+
+        search_kwargs = {
+            "max_cloud_cover": MAX_CLOUD_COVER,
+            "cache_dir": SEARCH_CACHE_DIR,
+            "ttl": SEARCH_CACHE_TTL,
+            "modifier": telemetry.timed("signing", pc.sign_inplace),
+        }
+        download_kwargs = {
+            "band_names": BANDS,
+            "max_workers": DOWNLOAD_WORKERS,
+            "max_per_host": MAX_REQUESTS_PER_HOST,
+            "bbox": BBOX if WINDOWED else None,
+            "manifest": Manifest(MANIFEST_PATH),
+            "rate_limit": DOWNLOAD_RATE_LIMIT,
+            "max_attempts": DOWNLOAD_MAX_ATTEMPTS,
+            "timeout": DOWNLOAD_TIMEOUT,
+            "telemetry": telemetry,
+        }
+        start_time = time.perf_counter()
+
+        if STREAM and not SELECT_SCENES:
+            # search all collections concurrently and download as pages arrive
+            print(f"  Streaming {COLLECTIONS} into the download stage...")
+            items = stream_search(
+                catalog, COLLECTIONS, BBOX, queue_size=SEARCH_QUEUE_SIZE, **search_kwargs
+            )
+            if TEST:
+                print("\nTEST MODE: Limiting downloads to 3 items per collection/mission\n")
+                items = limit_per_collection(items, COLLECTIONS, 3)
+            # re-sync only what the manifest is missing
+            items = only_missing(items, download_kwargs["manifest"], download_kwargs["bbox"])
+
+            stats = download_stream(
+                items, IMAGERY_DIR, start_time=start_time, **download_kwargs
+            )
+            print_download_summary(stats, telemetry)
+            return
 
-            search = catalog.search(**search_kwargs)
-            items[collection] = list(search.items())
+        # in streaming mode search overlaps the transfers, so only the
+        # batch path reports a separate search phase (signing excluded)
+        items = {collection: None for collection in COLLECTIONS}
+        with telemetry.phase("search"):
+            for collection in COLLECTIONS:
+                print(f"  Querying {collection}...")
+                items[collection] = cached_search(catalog, collection, BBOX, **search_kwargs)
 
 
         # =========================================================================
@@ -77,25 +170,51 @@ def main():
         print(f"Total Sentinel-2 items available: {len(items['hls2-s30'])}")
         print("=" * 70)
 
+        # =========================================================================
+        # SCENE SELECTION
+        # =========================================================================
+        if SELECT_SCENES:
+            # selection needs every footprint, so it runs on the full results
+            print("\nSelecting scenes that cover the bbox...")
+            selected = select_scenes(
+                [item for item_list in items.values() for item in item_list], BBOX
+            )
+            items = {
+                collection: [item for item in selected if item.collection_id == collection]
+                for collection in COLLECTIONS
+            }
+
         # =========================================================================
         # DOWNLOAD IMAGERY
         # =========================================================================
         
         if TEST:
             print("\nTEST MODE: Limiting downloads to 3 items per collection/mission\n")
-            random_integer = random.randint(0, min(len(items['hls2-l30']), len(items['hls2-s30']))-3)
+            random_integer = random.randint(0, max(min(len(items['hls2-l30']), len(items['hls2-s30'])) - 3, 0))
             idx = slice(random_integer, random_integer + 3)
             items = {collection: items[collection][idx] for collection in COLLECTIONS}
 
-        if items:
+        to_fetch = download_kwargs["manifest"].missing(
+            [item for item_list in items.values() for item in item_list],
+            BANDS,
+            window=download_kwargs["bbox"],
+            is_windowed=is_geotiff,
+        )
+        print(f"\n{len(to_fetch)} assets not yet in {MANIFEST_PATH}")
+
+        # re-sync only the items with assets the manifest is missing
+        fetch_ids = {item.id for item, _ in to_fetch}
+        items = {
+            collection: [item for item in item_list if item.id in fetch_ids]
+            for collection, item_list in items.items()
+        }
+
+        if fetch_ids:
             print("\nDownloading harmonized imagery...")
-            stats = download_items(items, IMAGERY_DIR, band_names=BANDS)
-
-            print("\nDownload Summary:")
-            print("=" * 70)
-            for k, v in stats.items():
-                print(f"  {k.replace('_', ' ').title()}: {v}")
-            print("=" * 70)
+            stats = download_items(
+                items, IMAGERY_DIR, start_time=start_time, **download_kwargs
+            )
+            print_download_summary(stats, telemetry)
         else:
             print("\nNo items to download")
 
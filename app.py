@@ -5,21 +5,28 @@ from functools import partial
 import gradio as gr
 import numpy as np
 import rasterio
-import torch
 from huggingface_hub import hf_hub_download
-from mmcv import Config
-from mmcv.parallel import collate, scatter
-from mmseg.apis import init_segmentor
-from mmseg.datasets.pipelines import Compose, LoadImageFromFile
-from mmseg.models import build_segmentor
 from skimage import exposure
 
-config_path=hf_hub_download(repo_id="ibm-nasa-geospatial/Prithvi-EO-1.0-100M-multi-temporal-crop-classification", 
-                            filename="multi_temporal_crop_classification_Prithvi_100M.py", 
-                            token=os.environ.get("token"))
-ckpt=hf_hub_download(repo_id="ibm-nasa-geospatial/Prithvi-EO-1.0-100M-multi-temporal-crop-classification", 
-                     filename='multi_temporal_crop_classification_Prithvi_100M.pth', 
-                     token=os.environ.get("token"))
+from onnx_backend import ONNX_MODEL, OnnxSegmentor
+
+# "torch" runs the mmseg model; "onnx" runs an exported model on ONNX Runtime
+# and needs neither torch nor mmcv/mmseg
+BACKEND = os.environ.get("BACKEND", "torch")
+
+if BACKEND == "torch":
+    import torch
+    from mmcv import Config
+    from mmcv.parallel import collate, scatter
+    from mmseg.apis import init_segmentor
+    from mmseg.datasets.pipelines import Compose, LoadImageFromFile
+
+    config_path=hf_hub_download(repo_id="ibm-nasa-geospatial/Prithvi-EO-1.0-100M-multi-temporal-crop-classification", 
+                                filename="multi_temporal_crop_classification_Prithvi_100M.py", 
+                                token=os.environ.get("token"))
+    ckpt=hf_hub_download(repo_id="ibm-nasa-geospatial/Prithvi-EO-1.0-100M-multi-temporal-crop-classification", 
+                         filename='multi_temporal_crop_classification_Prithvi_100M.pth', 
+                         token=os.environ.get("token"))
 ##########
 
 CDL_COLOR_MAP = [{'value': 1, 'label': 'Natural vegetation', 'rgb': (233,255,190)},
@@ -163,7 +170,10 @@ def inference_on_file(target_image, model, custom_test_pipeline):
     time_taken=-1
     st = time.time()
     print('Running inference...')
-    result = inference_segmentor(model, target_image, custom_test_pipeline)
+    if BACKEND == "onnx":
+        result = model.predict_file(target_image)
+    else:
+        result = inference_segmentor(model, target_image, custom_test_pipeline)
     print("Output has shape: " + str(result[0].shape))
 
     ##### get metadata mask
@@ -209,10 +219,14 @@ def process_test_pipeline(custom_test_pipeline, bands=None):
     
     return custom_test_pipeline
 
-config = Config.fromfile(config_path)
-config.model.backbone.pretrained=None
-model = init_segmentor(config, ckpt, device='cpu')
-custom_test_pipeline=process_test_pipeline(model.cfg.data.test.pipeline, None)
+if BACKEND == "onnx":
+    model = OnnxSegmentor(os.environ.get("ONNX_MODEL", ONNX_MODEL))
+    custom_test_pipeline = None
+else:
+    config = Config.fromfile(config_path)
+    config.model.backbone.pretrained=None
+    model = init_segmentor(config, ckpt, device='cpu')
+    custom_test_pipeline=process_test_pipeline(model.cfg.data.test.pipeline, None)
 
 func = partial(inference_on_file, model=model, custom_test_pipeline=custom_test_pipeline)
 
@@ -0,0 +1,120 @@
+"""
+Benchmark the acquisition path against the local STAC + COG fixture server.
+
+Runs the download engine over a grid of worker counts and modes (full
+downloads, BBOX-windowed reads, streamed search) and reports wall time,
+time to first file, throughput and retries. Results are printed as a table
+and written to JSON.
+"""
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from pystac_client import Client
+
+from config import BANDS, COLLECTIONS
+from fixture_server import FixtureServer
+from helpers import download_items, download_stream
+from search_cache import stream_search
+from telemetry import TransferLog
+
+# a small AOI inside the fixture tiles, as acquire_imagery.py uses in TEST mode
+AOI = [-93.5, 45, -93.3, 45.2]
+
+
+def run_once(catalog: Client, mode: str, workers: int, rate_limit: float | None) -> dict:
+    """Search and download everything once into a scratch directory."""
+    output_dir = Path(tempfile.mkdtemp(prefix="bench_acquire_"))
+    telemetry = TransferLog()
+    kwargs = {
+        "band_names": BANDS,
+        "max_workers": workers,
+        "max_per_host": workers,
+        "bbox": AOI if mode == "windowed" else None,
+        "rate_limit": rate_limit,
+        "telemetry": telemetry,
+    }
+    start_time = time.perf_counter()
+    try:
+        if mode == "stream":
+            items = stream_search(catalog, COLLECTIONS, AOI, cache_dir=output_dir / "cache", ttl=0)
+            stats = download_stream(items, str(output_dir / "data"), start_time=start_time, **kwargs)
+        else:
+            with telemetry.phase("search"):
+                items = {c: list(catalog.search(collections=c, bbox=AOI).items()) for c in COLLECTIONS}
+            stats = download_items(items, str(output_dir / "data"), start_time=start_time, **kwargs)
+        disk_bytes = sum(f.stat().st_size for f in (output_dir / "data").rglob("*.tif"))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    summary = telemetry.summary()
+    return {
+        "mode": mode,
+        "workers": workers,
+        "files": stats["files_downloaded"],
+        "failed": stats["failed"],
+        "retries": stats["retries"],
+        "time_to_first_file_s": stats["time_to_first_file"],
+        "wall_time_s": stats["wall_time"],
+        "bytes_transferred": stats["bytes_transferred"],
+        # windowed reads: local size of the crops, not bytes received
+        "bytes_written_windowed": stats["bytes_written_windowed"],
+        "disk_bytes": disk_bytes,
+        "mb_per_s": stats["mb_per_s"],
+        "phases_s": summary["phases_s"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark acquisition against a local fixture server.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--modes", nargs="+", default=["full", "windowed", "stream"], choices=["full", "windowed", "stream"])
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to each response")
+    parser.add_argument("--bandwidth", type=float, default=20e6, help="Bytes per second per response")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None, help="Client file transfers per second")
+    parser.add_argument("--tiles", type=int, default=2)
+    parser.add_argument("--dates", type=int, default=3)
+    parser.add_argument("--tile-size", type=int, default=1830)
+    parser.add_argument("--output", default="bench_acquisition.json")
+    args = parser.parse_args()
+
+    with FixtureServer(
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        n_tiles=args.tiles,
+        n_dates=args.dates,
+        tile_size=args.tile_size,
+    ) as server:
+        print(f"Fixture server with {len(server.items)} items at {server.url}")
+        catalog = Client.open(server.url)
+
+        results = []
+        for mode in args.modes:
+            for workers in args.workers:
+                results.append(run_once(catalog, mode, workers, args.rate_limit))
+
+    print("\nBenchmark Results")
+    print("=" * 90)
+    print(f"{'mode':<10}{'workers':>8}{'files':>7}{'failed':>8}{'retries':>9}{'first (s)':>11}{'wall (s)':>10}{'MB':>9}{'MB/s':>8}")
+    for r in results:
+        print(
+            f"{r['mode']:<10}{r['workers']:>8}{r['files']:>7}{r['failed']:>8}{r['retries']:>9}"
+            f"{r['time_to_first_file_s'] or 0:>11.2f}{r['wall_time_s']:>10.2f}"
+            f"{r['bytes_transferred'] / 1e6:>9.1f}{r['mb_per_s'] or 0:>8.1f}"
+        )
+    print("=" * 90)
+
+    with open(args.output, "w") as f:
+        json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Compare raster output profiles on write time, file size and read latency.
+
+Each profile in config.OUTPUT_PROFILES is applied to the same input raster
+(a processed scene, merged tile or chip). Random chip-sized windows are then
+read back, as the chipping and inference stages do, and their latency is
+reported.
+"""
+import argparse
+import json
+import random
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import rasterio
+from rasterio.windows import Window
+
+from config import CHIP_SIZE, OUTPUT_PROFILES
+from output_profiles import finalize_raster, tmp_path_for
+
+
+def read_latencies(path: Path, n_reads: int, size: int, seed: int = 0) -> np.ndarray:
+    """Seconds taken by ``n_reads`` random size x size window reads."""
+    rng = random.Random(seed)
+    latencies = []
+    # a fresh dataset per read keeps GDAL's block cache from hiding decode cost
+    with rasterio.Env(GDAL_CACHEMAX=0):
+        for _ in range(n_reads):
+            with rasterio.open(path) as src:
+                width, height = min(size, src.width), min(size, src.height)
+                col = rng.randint(0, src.width - width)
+                row = rng.randint(0, src.height - height)
+                start = time.perf_counter()
+                src.read(window=Window(col, row, width, height))
+                latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark raster output profiles.")
+    parser.add_argument("input", help="Raster to rewrite with each profile")
+    parser.add_argument("--profiles", nargs="+", default=list(OUTPUT_PROFILES))
+    parser.add_argument("--reads", type=int, default=200, help="Random window reads per profile")
+    parser.add_argument("--window", type=int, default=CHIP_SIZE, help="Window edge in pixels")
+    parser.add_argument("--output", default="bench_output_profiles.json")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="bench_profiles_"))
+    results = []
+    try:
+        for profile in args.profiles:
+            out = workdir / f"{profile}.tif"
+            tmp = tmp_path_for(out)
+
+            # every profile starts from the same plain GeoTIFF
+            with rasterio.open(args.input) as src:
+                meta = src.meta.copy()
+                meta.update(driver="GTiff")
+                with rasterio.open(tmp, "w", **meta) as dst:
+                    for _, window in src.block_windows(1):
+                        dst.write(src.read(window=window), window=window)
+
+            start = time.perf_counter()
+            try:
+                finalize_raster(tmp, out, profile)
+            except Exception as e:
+                print(f"  ✗ {profile} failed: {e}")
+                continue
+            write_time = time.perf_counter() - start
+
+            latencies = read_latencies(out, args.reads, args.window)
+            with rasterio.open(out) as src:
+                layout = f"{src.block_shapes[0]}, {src.compression.value if src.compression else 'none'}"
+            results.append(
+                {
+                    "profile": profile,
+                    "layout": layout,
+                    "write_s": round(write_time, 3),
+                    "size_mb": round(out.stat().st_size / 1e6, 2),
+                    "read_p50_ms": round(float(np.percentile(latencies, 50)) * 1e3, 2),
+                    "read_p90_ms": round(float(np.percentile(latencies, 90)) * 1e3, 2),
+                }
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print("\nOutput Profile Benchmark")
+    print("=" * 80)
+    print(f"{'profile':<12}{'layout':<26}{'write (s)':>10}{'size (MB)':>11}{'p50 (ms)':>10}{'p90 (ms)':>10}")
+    for r in results:
+        print(
+            f"{r['profile']:<12}{r['layout']:<26}{r['write_s']:>10.3f}{r['size_mb']:>11.2f}"
+            f"{r['read_p50_ms']:>10.2f}{r['read_p90_ms']:>10.2f}"
+        )
+    print("=" * 80)
+
+    with open(args.output, "w") as f:
+        json.dump({"input": args.input, "results": results}, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
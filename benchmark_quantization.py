@@ -0,0 +1,115 @@
+"""
+Accuracy versus speed of INT8 quantized inference on the example chips.
+
+The FP32 model and each quantization mode are run on every
+``chip_*_merged.tif``. For each mode the report gives latency per chip,
+serialised model size, overall agreement with the FP32 classes and
+per-class agreement (the share of pixels FP32 assigns to a class that the
+quantized model assigns to the same class).
+
+Static quantization is calibrated on the same chips it is evaluated on, as
+only a handful of examples ship with the repo; pass ``--calibration`` to
+use a separate set.
+"""
+import argparse
+import glob
+import json
+import time
+
+import numpy as np
+import torch
+
+from inference import CDL_COLOR_MAP, build_test_pipeline, load_model, prepare_data, run_model
+from quantization import QUANT_MODES, model_size, quantize_model
+
+
+def predict(model, prepared: dict, repeats: int) -> tuple[dict, list[float]]:
+    """Class maps per chip and per-run seconds."""
+    predictions, seconds = {}, []
+    for chip, data in prepared.items():
+        run_model(model, data)  # warm-up
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = run_model(model, data)
+            seconds.append(time.perf_counter() - start)
+        predictions[chip] = np.asarray(result[0])
+    return predictions, seconds
+
+
+def agreement(reference: dict, predictions: dict) -> tuple[float, dict]:
+    """Overall and per-class agreement of ``predictions`` with ``reference``."""
+    ref = np.concatenate([reference[c].ravel() for c in reference])
+    pred = np.concatenate([predictions[c].ravel() for c in reference])
+    per_class = {}
+    for entry in CDL_COLOR_MAP:
+        in_class = ref == entry["value"] - 1
+        if in_class.any():
+            per_class[entry["label"]] = float((pred[in_class] == ref[in_class]).mean())
+    return float((pred == ref).mean()), per_class
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark INT8 quantized inference against FP32.")
+    parser.add_argument("--chips", default="chip_*_merged.tif", help="Glob of evaluation chips")
+    parser.add_argument("--calibration", default=None, help="Glob of calibration chips (default: --chips)")
+    parser.add_argument("--modes", nargs="+", default=list(QUANT_MODES), choices=QUANT_MODES)
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per chip")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--output", default="bench_quantization.json")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    chips = sorted(glob.glob(args.chips))
+    if not chips:
+        raise ValueError(f"No chips match {args.chips}")
+
+    model, custom_test_pipeline = load_model(device="cpu")
+    test_pipeline = build_test_pipeline(model, custom_test_pipeline)
+    prepared = {chip: prepare_data(test_pipeline, chip) for chip in chips}
+    calibration_files = sorted(glob.glob(args.calibration)) if args.calibration else chips
+    calibration = [prepare_data(test_pipeline, f)[0]["img"][0] for f in calibration_files]
+
+    reference, seconds = predict(model, prepared, args.repeats)
+    results = [
+        {
+            "mode": "fp32",
+            "mean_s": float(np.mean(seconds)),
+            "size_mb": model_size(model) / 1e6,
+            "agreement": 1.0,
+            "per_class": {},
+        }
+    ]
+    for mode in args.modes:
+        quantized = quantize_model(model, mode, calibration)
+        predictions, seconds = predict(quantized, prepared, args.repeats)
+        overall, per_class = agreement(reference, predictions)
+        results.append(
+            {
+                "mode": mode,
+                "mean_s": float(np.mean(seconds)),
+                "size_mb": model_size(quantized) / 1e6,
+                "agreement": overall,
+                "per_class": per_class,
+            }
+        )
+
+    base = results[0]["mean_s"]
+    print(f"\n{'mode':>8} {'s/chip':>8} {'speed-up':>9} {'size MB':>8} {'agree':>7}")
+    for r in results:
+        print(
+            f"{r['mode']:>8} {r['mean_s']:>8.3f} {base / r['mean_s']:>8.2f}x "
+            f"{r['size_mb']:>8.1f} {r['agreement']:>6.1%}"
+        )
+    for r in results[1:]:
+        print(f"\nPer-class agreement, {r['mode']}:")
+        for label, value in r["per_class"].items():
+            print(f"  {label:<22} {value:>6.1%}")
+
+    with open(args.output, "w") as f:
+        json.dump({"chips": chips, "calibration": calibration_files, "results": results}, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
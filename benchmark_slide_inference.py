@@ -0,0 +1,86 @@
+"""
+Benchmark batched sliding-window inference on the bundled example chips.
+
+Each ``chip_*_merged.tif`` is run through the crop-classification model
+with several ``test_cfg.crop_batch_size`` settings. Latency per chip is
+reported together with the agreement of the predicted classes with the
+one-window-at-a-time baseline, which should be 100%.
+"""
+import argparse
+import glob
+import json
+import time
+
+import numpy as np
+import torch
+
+from inference import build_test_pipeline, load_model, prepare_data, run_model
+
+
+def time_chip(model, data, repeats: int) -> tuple[np.ndarray, list[float]]:
+    """Prediction and per-run seconds for one prepared chip."""
+    run_model(model, data)  # warm-up
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = run_model(model, data)
+        seconds.append(time.perf_counter() - start)
+    return np.asarray(result[0]), seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched sliding-window inference.")
+    parser.add_argument("--chips", default="chip_*_merged.tif", help="Glob of input chips")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 9])
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per chip and batch size")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    parser.add_argument("--output", default="bench_slide_inference.json")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    chips = sorted(glob.glob(args.chips))
+    if not chips:
+        raise ValueError(f"No chips match {args.chips}")
+
+    model, custom_test_pipeline = load_model()
+    test_pipeline = build_test_pipeline(model, custom_test_pipeline)
+    prepared = {chip: prepare_data(test_pipeline, chip) for chip in chips}
+    n_windows = len(model.slide_windows(*prepared[chips[0]][0]["img"][0].shape[-2:]))
+    print(f"{len(chips)} chips, {n_windows} windows each, {torch.get_num_threads()} threads")
+
+    baseline = {}
+    results = []
+    for batch_size in args.batch_sizes:
+        model.test_cfg.crop_batch_size = batch_size
+        seconds, agreement = [], []
+        for chip, data in prepared.items():
+            pred, runs = time_chip(model, data, args.repeats)
+            baseline.setdefault(chip, pred)
+            seconds.extend(runs)
+            agreement.append(float((pred == baseline[chip]).mean()))
+        results.append(
+            {
+                "crop_batch_size": batch_size,
+                "mean_s": float(np.mean(seconds)),
+                "p50_s": float(np.percentile(seconds, 50)),
+                "p90_s": float(np.percentile(seconds, 90)),
+                "agreement": float(np.mean(agreement)),
+            }
+        )
+
+    base = results[0]["mean_s"]
+    print(f"\n{'batch':>6} {'mean s':>8} {'p50 s':>8} {'p90 s':>8} {'speed-up':>9} {'agree':>7}")
+    for r in results:
+        print(
+            f"{r['crop_batch_size']:>6} {r['mean_s']:>8.3f} {r['p50_s']:>8.3f} {r['p90_s']:>8.3f} "
+            f"{base / r['mean_s']:>8.2f}x {r['agreement']:>6.1%}"
+        )
+
+    with open(args.output, "w") as f:
+        json.dump({"chips": chips, "windows_per_chip": n_windows, "results": results}, f, indent=2)
+    print(f"\nWrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
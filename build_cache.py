@@ -0,0 +1,151 @@
+import hashlib
+import inspect
+import json
+import sqlite3
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Iterable
+
+from manifest import file_sha256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path     TEXT PRIMARY KEY,
+    size     INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256   TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS targets (
+    output      TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    mtime_ns    INTEGER NOT NULL,
+    built       TEXT NOT NULL
+);
+"""
+
+
+def code_version(*objects) -> str:
+    """SHA-256 of the source of the functions or modules that build an output.
+
+    Editing any of them changes the fingerprint of everything they produce.
+    """
+    digest = hashlib.sha256()
+    for obj in objects:
+        digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """SQLite record of how every derived raster was built.
+
+    Each output is stored with a fingerprint of what went into it: the
+    content hashes of its input files, the processing parameters and the
+    source of the code that made it. An output is fresh while its recorded
+    fingerprint matches the current one and the file on disk still has the
+    recorded size and modification time; anything else is rebuilt.
+
+    Input files are content addressed, but their hashes are memoised by
+    (path, size, mtime) so unchanged files are never read twice. A file that
+    is rewritten with identical content keeps its hash, so nothing
+    downstream of it is rebuilt.
+
+    Args:
+        path: SQLite database file, created if missing
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def file_hash(self, path: Path) -> str:
+        """SHA-256 of a file, recomputed only when its size or mtime changed."""
+        stat = Path(path).stat()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM files WHERE path = ?", (str(path),)
+            ).fetchone()
+        if row and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+
+        sha256 = file_sha256(path)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns, sha256),
+            )
+            self._conn.commit()
+        return sha256
+
+    def fingerprint(self, inputs: Iterable[Path] = (), params: dict = None, code: str = "") -> str:
+        """Fingerprint of one build step.
+
+        Args:
+            inputs: Files read by the step; hashed by content
+            params: JSON-serialisable parameters of the step
+            code: Code version of the step, from ``code_version``
+
+        Returns:
+            SHA-256 hex digest
+        """
+        key = {
+            "inputs": sorted((Path(p).name, self.file_hash(p)) for p in inputs),
+            "params": params or {},
+            "code": code,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+    def is_fresh(self, output: Path, fingerprint: str) -> bool:
+        """Whether ``output`` exists and was built from ``fingerprint``."""
+        output = Path(output)
+        if not output.exists():
+            return False
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, size, mtime_ns FROM targets WHERE output = ?", (str(output),)
+            ).fetchone()
+        stat = output.stat()
+        return row == (fingerprint, stat.st_size, stat.st_mtime_ns)
+
+    def recorded(self, output: Path) -> str | None:
+        """Fingerprint ``output`` was last built from, or None if unknown or modified since."""
+        output = Path(output)
+        if not output.exists():
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fingerprint, size, mtime_ns FROM targets WHERE output = ?", (str(output),)
+            ).fetchone()
+        stat = output.stat()
+        if row is None or row[1:] != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return row[0]
+
+    def record(self, output: Path, fingerprint: str):
+        """Store the fingerprint of a freshly built output."""
+        stat = Path(output).stat()
+        row = (
+            str(output),
+            fingerprint,
+            stat.st_size,
+            stat.st_mtime_ns,
+            datetime.now(timezone.utc).isoformat(),
+        )
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO targets VALUES (?, ?, ?, ?, ?)", row)
+            self._conn.commit()
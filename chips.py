@@ -0,0 +1,292 @@
+"""
+Cut multi-temporal model chips from the HLS datacube.
+
+Each chip stacks the six HLS bands for three time steps into the 18-band,
+time-major layout the Prithvi crop-classification model expects (the same
+layout as the bundled ``chip_*_merged.tif`` examples), in the 0-10000
+reflectance range assumed by ``img_norm_cfg``. Chips are cut on a regular
+grid with configurable overlap and written in parallel, either as GeoTIFFs
+or into one memory-mapped array, together with an index of chip bounds for
+mosaicking predictions back together.
+"""
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.windows import Window, bounds as window_bounds
+from shapely import box
+from tqdm import tqdm
+
+from build_cache import BuildCache, code_version
+from config import BUILD_CACHE_PATH, CHIP_SIZE, DATA_DIR, INT_NODATA, REFLECTANCE_SCALE, STORAGE_DTYPE
+from datacube import open_cube
+
+NUM_FRAMES = 3  # time steps per chip, as num_frames in the model config
+CHIP_NODATA = INT_NODATA
+
+
+def chip_grid(width: int, height: int, size: int = CHIP_SIZE, overlap: int = 0) -> list[tuple[int, int]]:
+    """Top-left (row, col) of chips covering a raster, last row/col flush with the edge."""
+    stride = size - overlap
+    if stride <= 0:
+        raise ValueError(f"overlap ({overlap}) must be smaller than the chip size ({size})")
+
+    def starts(length):
+        if length <= size:
+            return [0]
+        positions = list(range(0, length - size, stride))
+        return positions + [length - size]
+
+    return [(row, col) for row in starts(height) for col in starts(width)]
+
+
+def pick_time_steps(
+    valid: np.ndarray,
+    cloud_cover: np.ndarray,
+    n_frames: int = NUM_FRAMES,
+    min_valid: float = 0.9,
+) -> list[int] | None:
+    """Choose one time step from each of ``n_frames`` parts of the season.
+
+    The time axis (sorted by date) is split into ``n_frames`` equal parts;
+    from each, the step with the most valid pixels in the chip is taken,
+    ties going to lower cloud cover.
+
+    Args:
+        valid: Fraction of valid pixels in the chip per time step
+        cloud_cover: Scene cloud cover per time step
+        n_frames: Number of time steps to pick
+        min_valid: Smallest valid fraction a picked step may have
+
+    Returns:
+        Indices of the picked time steps, or None if a part has no step with
+        enough valid pixels
+    """
+    if len(valid) < n_frames:
+        return None
+    cloud_cover = np.nan_to_num(cloud_cover, nan=100.0)
+    picked = []
+    for part in np.array_split(np.arange(len(valid)), n_frames):
+        best = max(part, key=lambda t: (valid[t], -cloud_cover[t]))
+        if valid[best] < min_valid:
+            return None
+        picked.append(int(best))
+    return picked
+
+
+def valid_pixels(data: np.ndarray, fill_value=None) -> np.ndarray:
+    """Mask of valid pixels in undecoded cube values."""
+    valid = np.isfinite(data) if np.issubdtype(data.dtype, np.floating) else np.ones(data.shape, dtype=bool)
+    if fill_value is not None and not np.isnan(fill_value):
+        valid &= data != fill_value
+    return valid
+
+
+def chip_time_steps(cube, row: int, col: int, size: int, n_frames: int, min_valid: float) -> list[int] | None:
+    """Pick the time steps for one chip from the valid pixels of its first band."""
+    first_band = cube.reflectance.isel(band=0, y=slice(row, row + size), x=slice(col, col + size)).values
+    valid = valid_pixels(first_band, cube.reflectance.attrs.get("_FillValue")).mean(axis=(1, 2))
+    return pick_time_steps(valid, cube.cloud_cover.values, n_frames, min_valid)
+
+
+def read_chip(cube, row: int, col: int, size: int, steps: list[int], dtype: str = STORAGE_DTYPE) -> np.ndarray:
+    """Read the picked time steps of one chip as a time-major band stack.
+
+    Values are reflectance x REFLECTANCE_SCALE in ``dtype``; the model
+    pipeline only converts them to float when normalising. ``cube`` is
+    opened undecoded (``open_cube(store, decode=False)``), so an int16 cube,
+    which already stores reflectance x REFLECTANCE_SCALE, is copied as is
+    rather than decoded to float and quantised again.
+    """
+    reflectance = cube.reflectance
+    data = reflectance.isel(time=steps, y=slice(row, row + size), x=slice(col, col + size)).values
+    data = data.reshape(-1, data.shape[-2], data.shape[-1])  # (time, band, y, x) -> (time * band, y, x)
+    valid = valid_pixels(data, reflectance.attrs.get("_FillValue"))
+    scale = reflectance.attrs.get("reflectance_scale")  # stored integers are reflectance x scale
+    if np.issubdtype(data.dtype, np.integer) and scale == REFLECTANCE_SCALE:
+        return np.where(valid, data, CHIP_NODATA).astype(dtype)
+    if scale:
+        data = data / scale
+    data = np.where(valid, np.round(data * REFLECTANCE_SCALE), CHIP_NODATA)
+    return data.astype(dtype)
+
+
+def write_chips(
+    store: Path,
+    output_dir: Path,
+    size: int = CHIP_SIZE,
+    overlap: int = 0,
+    n_frames: int = NUM_FRAMES,
+    min_valid: float = 0.9,
+    memmap: bool = False,
+    n_jobs: int = 8,
+    cache: BuildCache | None = None,
+    dtype: str = STORAGE_DTYPE,
+) -> Path:
+    """Cut and write multi-temporal chips from a datacube.
+
+    Chips are processed by a thread pool; each thread reads its window from
+    the Zarr store and writes its own output, so no two threads touch the
+    same file (or the same slot of the memory-mapped array).
+
+    With a build cache, a GeoTIFF chip is only rewritten when its picked
+    scenes or their cube fingerprints (see ``datacube.append_scenes``), the
+    cube grid, the chip parameters or the chip code have changed, so
+    appending or reprocessing a scene rewrites just the chips it affects. The
+    memory-mapped array is always written in full.
+
+    Args:
+        store: Zarr datacube built by datacube.py
+        output_dir: Directory for the chips and index
+        size: Chip edge in pixels
+        overlap: Pixels shared by neighbouring chips
+        n_frames: Time steps per chip
+        min_valid: Smallest valid-pixel fraction of every picked time step
+        memmap: Write all chips into one ``chips.npy`` (n, bands, size, size)
+                array instead of one GeoTIFF per chip
+        n_jobs: Number of threads
+        cache: Optional build cache for incremental GeoTIFF chips
+        dtype: Chip data type, "int16" or "float32"
+
+    Returns:
+        Path of the chip index (GeoJSON)
+    """
+    cube = open_cube(store, decode=False)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    transform = rasterio.Affine(*cube.attrs["transform"][:6])
+    positions = chip_grid(cube.sizes["x"], cube.sizes["y"], size, overlap)
+    times = cube.time.values
+    scene_ids = cube.scene_id.values
+    # what each time step was built from; cubes built without a cache only have ids
+    has_fingerprints = "fingerprint" in cube.coords and all(cube.fingerprint.values)
+    scene_fingerprints = cube.fingerprint.values if has_fingerprints else scene_ids
+
+    array = None
+    if memmap:
+        array = np.lib.format.open_memmap(
+            output_dir / "chips.npy",
+            mode="w+",
+            dtype=dtype,
+            shape=(len(positions), 6 * n_frames, size, size),
+        )
+
+    profile = {
+        "driver": "GTiff",
+        "width": size,
+        "height": size,
+        "count": 6 * n_frames,
+        "dtype": dtype,
+        "crs": cube.attrs["crs"],
+        "nodata": CHIP_NODATA,
+        "tiled": True,
+        "blockxsize": size,
+        "blockysize": size,
+        "compress": "deflate",
+        "predictor": 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2,
+    }
+
+    code = code_version(chip_time_steps, read_chip, pick_time_steps, valid_pixels)
+    params = {
+        "size": size,
+        "frames": n_frames,
+        "min_valid": min_valid,
+        "scale": REFLECTANCE_SCALE,
+        "dtype": dtype,
+        "grid": {"crs": cube.attrs["crs"], "transform": list(transform)},
+    }
+    skipped = []  # list.append is atomic across threads
+
+    def work(k):
+        row, col = positions[k]
+        steps = chip_time_steps(cube, row, col, size, n_frames, min_valid)
+        if steps is None:
+            if array is not None:
+                array[k] = CHIP_NODATA
+            return None
+        window = Window(col, row, size, size)
+        record = {
+            "chip_id": f"chip_{row}_{col}",
+            "index": k,
+            "row": row,
+            "col": col,
+            "dates": [str(np.datetime_as_string(times[t], unit="D")) for t in steps],
+            "scene_ids": [str(scene_ids[t]) for t in steps],
+            "geometry": box(*window_bounds(window, transform)),
+        }
+        if array is not None:
+            array[k] = read_chip(cube, row, col, size, steps, dtype)
+            return record
+
+        path = output_dir / f"{record['chip_id']}_merged.tif"
+        record["path"] = path.name
+        if cache is not None:
+            scenes = [str(scene_fingerprints[t]) for t in steps]
+            fingerprint = cache.fingerprint(params=params | {"row": row, "col": col, "scenes": scenes}, code=code)
+            if cache.is_fresh(path, fingerprint):
+                skipped.append(k)
+                return record
+        with rasterio.open(path, "w", transform=rasterio.windows.transform(window, transform), **profile) as dst:
+            dst.write(read_chip(cube, row, col, size, steps, dtype))
+        if cache is not None:
+            cache.record(path, fingerprint)
+        return record
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        records = [
+            r
+            for r in tqdm(executor.map(work, range(len(positions))), total=len(positions), desc="Writing chips")
+            if r is not None
+        ]
+
+    if array is not None:
+        array.flush()
+
+    index_path = output_dir / "chips_index.geojson"
+    if not records:
+        # GeoDataFrame cannot infer a geometry column from no rows; write an
+        # empty collection so a stale index from an earlier run is replaced
+        print(f"⊘ No chip has {n_frames} time steps with {min_valid:.0%} valid pixels")
+        with open(index_path, "w") as f:
+            json.dump({"type": "FeatureCollection", "features": []}, f)
+        return index_path
+
+    index = gpd.GeoDataFrame(records, geometry="geometry", crs=cube.attrs["crs"])
+    index["dates"] = index["dates"].apply(json.dumps)
+    index["scene_ids"] = index["scene_ids"].apply(json.dumps)
+    index.to_file(index_path, driver="GeoJSON")
+    print(f"Wrote {len(records) - len(skipped)} of {len(positions)} chips to {output_dir} ({len(skipped)} up to date)")
+    return index_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cut multi-temporal model chips from the HLS datacube.")
+    parser.add_argument("--store", type=Path, default=DATA_DIR / "hls_cube.zarr", help="Zarr datacube")
+    parser.add_argument("--output-dir", type=Path, default=DATA_DIR / "chips")
+    parser.add_argument("--size", type=int, default=CHIP_SIZE, help="Chip edge in pixels")
+    parser.add_argument("--overlap", type=int, default=0, help="Pixels shared by neighbouring chips")
+    parser.add_argument("--frames", type=int, default=NUM_FRAMES, help="Time steps per chip")
+    parser.add_argument("--min-valid", type=float, default=0.9, help="Minimum valid-pixel fraction per time step")
+    parser.add_argument("--memmap", action="store_true", help="Write one memory-mapped array instead of GeoTIFFs")
+    parser.add_argument("--jobs", type=int, default=8, help="Writer threads")
+    parser.add_argument("--rebuild", action="store_true", help="Rewrite every chip, ignoring the build cache")
+    args = parser.parse_args()
+
+    write_chips(
+        args.store,
+        args.output_dir,
+        size=args.size,
+        overlap=args.overlap,
+        n_frames=args.frames,
+        min_valid=args.min_valid,
+        memmap=args.memmap,
+        n_jobs=args.jobs,
+        cache=None if args.rebuild else BuildCache(BUILD_CACHE_PATH),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 from pathlib import Path
 
 DATA_DIR = Path.home() / "data_science/geospatial/mpls_land_use/data"
+BUILD_CACHE_PATH = DATA_DIR / "build_cache.sqlite"  # fingerprints of derived rasters
 
 # Minneapolis-St. Paul metro area bounding box
 BBOX = [-94.22608230, 44.53677921, -92.51781747, 45.36347663]
@@ -34,4 +35,47 @@ BANDS = {
 }
 
 COLLECTIONS = ["hls2-s30", "hls2-l30"]  # Sentinel-2 and Landsat harmonized collections
-PC_CATALOG = "https://planetarycomputer.microsoft.com/api/stac/v1"
\ No newline at end of file
+PC_CATALOG = "https://planetarycomputer.microsoft.com/api/stac/v1"
+
+# concurrent download settings
+DOWNLOAD_WORKERS = 8  # threads fetching band files
+MAX_REQUESTS_PER_HOST = 4  # in-flight requests against any one host
+DOWNLOAD_RATE_LIMIT = 20  # sustained file transfers started per second, None for no limit
+DOWNLOAD_MAX_ATTEMPTS = 5  # attempts per file before it counts as failed
+DOWNLOAD_TIMEOUT = (10, 60)  # (connect, read) seconds; read is per socket read
+
+# on-disk STAC search cache
+SEARCH_CACHE_DIR = Path(".stac_cache")
+SEARCH_CACHE_TTL = 6 * 3600  # seconds before cached results are refreshed
+SEARCH_QUEUE_SIZE = 64  # items buffered between the search and download stages
+
+# raster output profiles for processed, merged and chip rasters
+CHIP_SIZE = 224  # model input tile size, in pixels
+OUTPUT_PROFILES = {
+    # GDAL defaults: striped, uncompressed, no overviews
+    "default": None,
+    # tiled COG with blocks matching the chip size
+    "cog": {
+        "blocksize": CHIP_SIZE,
+        "compress": "DEFLATE",
+        "level": 6,
+        "overviews": "AUTO",
+        "overview_resampling": "AVERAGE",
+        "mask": True,
+    },
+    # smaller and faster to decode where GDAL is built with ZSTD
+    "cog-zstd": {
+        "blocksize": CHIP_SIZE,
+        "compress": "ZSTD",
+        "level": 9,
+        "overviews": "AUTO",
+        "overview_resampling": "AVERAGE",
+        "mask": True,
+    },
+}
+OUTPUT_PROFILE = "cog"
+
+# pixel storage for processed, merged, datacube and chip rasters
+STORAGE_DTYPE = "int16"  # "int16": reflectance x REFLECTANCE_SCALE; "float32": reflectance 0-1
+REFLECTANCE_SCALE = 10000  # HLS scale; also the range img_norm_cfg assumes
+INT_NODATA = -9999  # nodata value of integer rasters
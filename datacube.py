@@ -0,0 +1,315 @@
+"""
+Build a chunked Zarr time-series datacube from processed HLS scenes.
+
+Each processed scene (``*_processed.tif``) becomes one time step of a
+(time, band, y, x) array on a common grid covering the configured BBOX.
+Scenes already in the cube are skipped, so rebuilding after new downloads
+only appends the new scenes; with the build cache, scenes that were
+reprocessed since are rewritten in place.
+"""
+import argparse
+import math
+import shutil
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rioxarray
+import xarray as xr
+import zarr
+from numcodecs import Blosc
+from rasterio.enums import Resampling
+from rasterio.transform import from_origin
+from rasterio.vrt import WarpedVRT
+
+from build_cache import BuildCache, code_version
+from config import BBOX, BUILD_CACHE_PATH, CHIP_SIZE, DATA_DIR, HLS_CRS, INT_NODATA, REFLECTANCE_SCALE, STORAGE_DTYPE
+from process_imagery import convert_bbox_crs
+
+RESOLUTION = 30  # metres, as HLS
+HLS_BANDS = ["blue", "green", "red", "nir", "swir1", "swir2"]
+SENSORS = {"S30": "hls2-s30", "L30": "hls2-l30"}
+
+# one time step, all bands, one chip per chunk: a 3-date chip is 3-12 reads
+CHUNKS = {"time": 1, "band": len(HLS_BANDS), "y": CHIP_SIZE, "x": CHIP_SIZE}
+COMPRESSOR = Blosc(cname="zstd", clevel=5, shuffle=Blosc.BITSHUFFLE)
+# on-disk encoding of reflectance. int16 cubes hold reflectance x
+# REFLECTANCE_SCALE, named by a ``reflectance_scale`` attribute rather than a
+# CF scale_factor, so int16 scenes are copied in without a float round trip
+# and xarray never rescales the integers on append; open_cube decodes them.
+REFLECTANCE_ENCODING = {
+    "float32": {"dtype": "float32"},
+    "int16": {"dtype": "int16", "_FillValue": INT_NODATA},
+}
+
+
+def cube_grid(bbox: list[float], resolution: float = RESOLUTION) -> tuple:
+    """Common grid covering ``bbox`` (in HLS_CRS), snapped to the HLS pixel grid.
+
+    Returns:
+        Tuple of (transform, width, height)
+    """
+    left = math.floor(bbox[0] / resolution) * resolution
+    top = math.ceil(bbox[3] / resolution) * resolution
+    width = math.ceil((bbox[2] - left) / resolution)
+    height = math.ceil((top - bbox[1]) / resolution)
+    return from_origin(left, top, resolution, resolution), width, height
+
+
+def scene_metadata(processed_tif: Path) -> dict:
+    """Scene id, sensor, acquisition time and cloud cover of a processed scene.
+
+    The id, sensor and time come from the HLS file name; cloud cover from the
+    ``cloud_coverage`` tag of the original band files, when they are present.
+    """
+    scene_id = processed_tif.name.split("_")[0]
+    parts = scene_id.split(".")
+    cloud_cover = np.nan
+    band_files = sorted((processed_tif.parent / scene_id).glob("B*.tif"))
+    if band_files:
+        with rasterio.open(band_files[0]) as src:
+            cloud_cover = float(src.tags().get("cloud_coverage", np.nan))
+    return {
+        "scene_id": scene_id,
+        "sensor": SENSORS.get(parts[1], parts[1]),
+        "time": datetime.strptime(parts[3], "%Y%jT%H%M%S"),
+        "cloud_cover": cloud_cover,
+    }
+
+
+def cube_inputs(data_dir: Path) -> list[Path]:
+    """Processed scenes for the cube, one per date and sensor where merged.
+
+    Where same-day tiles were merged (as a raster or VRT), the mosaic is used
+    in place of its individual granules.
+    """
+    def key(path):
+        parts = path.name.split("_")[0].split(".")
+        return parts[1], parts[3].split("T")[0]
+
+    merged = sorted(data_dir.glob("HLS*_merged_processed.tif")) + sorted(
+        data_dir.glob("HLS*_merged_processed.vrt")
+    )
+    merged_keys = {key(p) for p in merged}
+    singles = [
+        p
+        for p in sorted(data_dir.glob("HLS*_processed.tif"))
+        if not p.name.endswith("_merged_processed.tif") and key(p) not in merged_keys
+    ]
+    return sorted(singles + merged)
+
+
+def scene_on_grid(
+    processed_tif: Path,
+    transform,
+    width: int,
+    height: int,
+    stack: ExitStack,
+    dtype: str = STORAGE_DTYPE,
+) -> xr.DataArray:
+    """Lazily warp a processed scene onto the cube grid as a dask array.
+
+    Values come out in the cube's storage form: int16 reflectance x
+    REFLECTANCE_SCALE with INT_NODATA, or float32 reflectance with NaN.
+    Integer scenes going into an int16 cube are warped as integers (nearest
+    neighbour), so their values are copied unchanged.
+
+    The dataset and warped VRT stay open until ``stack`` is closed, which must
+    happen only after the array has been computed (e.g. written to Zarr).
+    """
+    src = stack.enter_context(rasterio.open(processed_tif))
+    integer_source = np.issubdtype(np.dtype(src.dtypes[0]), np.integer)
+    integer_cube = np.issubdtype(np.dtype(dtype), np.integer)
+    copy_integers = integer_source and integer_cube
+    vrt = stack.enter_context(WarpedVRT(
+        src,
+        crs=HLS_CRS,
+        transform=transform,
+        width=width,
+        height=height,
+        resampling=Resampling.nearest,
+        nodata=INT_NODATA if copy_integers else np.nan,
+        dtype=dtype if copy_integers else "float32",
+    ))
+    da = rioxarray.open_rasterio(vrt, chunks={"band": -1, "y": CHUNKS["y"], "x": CHUNKS["x"]})
+    if not copy_integers:
+        if integer_source:
+            da = da / REFLECTANCE_SCALE  # int16 scenes store scaled reflectance
+        if integer_cube:
+            da = (da * REFLECTANCE_SCALE).round().fillna(INT_NODATA).astype(dtype)
+    # nodata is set by the store's encoding, not carried over from the VRT
+    da.attrs, da.encoding = {}, {}
+    return da.assign_coords(band=HLS_BANDS[: da.sizes["band"]])
+
+
+def scene_fingerprint(cache: BuildCache, processed_tif: Path) -> str:
+    """Fingerprint of one cube time step: how its processed scene was built.
+
+    The scene's build-cache fingerprint is used where there is one, so a
+    merged VRT changes when its source tiles do; otherwise the file's
+    content hash. The warp onto the cube grid and the storage type are
+    folded in too.
+    """
+    source = cache.recorded(processed_tif) or cache.file_hash(processed_tif)
+    return cache.fingerprint(params={"source": source, "dtype": STORAGE_DTYPE}, code=code_version(scene_on_grid))
+
+
+def append_scenes(
+    processed_tifs: list[Path],
+    store: Path,
+    bbox: list[float] = None,
+    cache: BuildCache | None = None,
+) -> int:
+    """Append processed scenes to a Zarr datacube, creating it if needed.
+
+    Scenes whose id is not yet in the cube are appended along ``time`` in
+    date order. The cube grid is fixed when the store is created, and every
+    later scene is warped onto it.
+
+    With a build cache, each time step carries the fingerprint of the scene
+    it was built from (the ``fingerprint`` coordinate). A scene already in
+    the cube is rewritten in place when its fingerprint has changed, e.g.
+    after it was reprocessed, and skipped otherwise; chips.py keys its
+    chips on these fingerprints. Without a cache, scenes already in the cube
+    are skipped by id.
+
+    Args:
+        processed_tifs: Processed scenes
+        store: Path of the Zarr store
+        bbox: Bounding box in HLS_CRS for a new cube; defaults to config.BBOX
+        cache: Optional build cache for scene fingerprints
+
+    Returns:
+        Number of scenes appended or rewritten
+    """
+    known = {}  # scene id -> (time index in the store, fingerprint)
+    if store.exists():
+        existing = xr.open_zarr(store)
+        if "fingerprint" not in existing.coords or "scale_factor" in existing.reflectance.encoding:
+            # written by an earlier version of this module
+            existing.close()
+            print(f"⊘ {store} has no scene fingerprints or an outdated encoding, rebuilding it")
+            shutil.rmtree(store)
+        else:
+            known = {
+                scene_id: (i, fingerprint)
+                for i, (scene_id, fingerprint) in enumerate(
+                    zip(existing.scene_id.values.tolist(), existing.fingerprint.values.tolist())
+                )
+            }
+            transform = rasterio.Affine(*existing.attrs["transform"][:6])
+            width, height = existing.sizes["x"], existing.sizes["y"]
+            existing.close()
+    if not store.exists():
+        transform, width, height = cube_grid(bbox if bbox is not None else convert_bbox_crs(BBOX))
+
+    scenes = [scene_metadata(tif) | {"path": tif} for tif in processed_tifs]
+    for scene in scenes:
+        scene["fingerprint"] = scene_fingerprint(cache, scene["path"]) if cache is not None else ""
+
+    # the cube as a whole is fresh when it was last built from exactly these scenes
+    cube_marker = store / ".zmetadata"
+    cube_fingerprint = None
+    if cache is not None:
+        grid = {"crs": HLS_CRS, "transform": list(transform), "width": width, "height": height}
+        cube_fingerprint = cache.fingerprint(
+            params={"grid": grid, "scenes": sorted(s["fingerprint"] for s in scenes)}
+        )
+        if cache.is_fresh(cube_marker, cube_fingerprint):
+            print(f"{store} is up to date")
+            return 0
+
+    def changed(scene):
+        if scene["scene_id"] not in known:
+            return True
+        return cache is not None and known[scene["scene_id"]][1] != scene["fingerprint"]
+
+    scenes = sorted((s for s in scenes if changed(s)), key=lambda s: s["time"])
+    if not scenes:
+        print(f"{store} is up to date")
+        if cache is not None and cube_marker.exists():
+            cache.record(cube_marker, cube_fingerprint)
+        return 0
+
+    for scene in scenes:
+        with ExitStack() as stack:
+            da = scene_on_grid(scene["path"], transform, width, height, stack)
+            ds = (
+                da.expand_dims(time=[np.datetime64(scene["time"], "ns")])
+                .assign_coords(
+                    sensor=("time", [scene["sensor"]]),
+                    cloud_cover=("time", [scene["cloud_cover"]]),
+                    scene_id=("time", [scene["scene_id"]]),
+                    fingerprint=("time", [scene["fingerprint"]]),
+                )
+                .to_dataset(name="reflectance")
+                .drop_vars("spatial_ref", errors="ignore")
+                .chunk(CHUNKS)
+            )
+            ds.attrs = {"crs": HLS_CRS, "transform": list(transform)}
+            if np.issubdtype(np.dtype(STORAGE_DTYPE), np.integer):
+                ds.reflectance.attrs["reflectance_scale"] = REFLECTANCE_SCALE
+
+            if scene["scene_id"] in known:
+                # reprocessed scene: overwrite its time step in place
+                i = known[scene["scene_id"]][0]
+                ds.drop_vars(["band", "y", "x"]).to_zarr(store, region={"time": slice(i, i + 1)})
+                action = "rewrote"
+            elif store.exists():
+                ds.to_zarr(store, append_dim="time")
+                action = "appended"
+            else:
+                ds.to_zarr(
+                    store,
+                    mode="w",
+                    encoding={
+                        "reflectance": {"compressor": COMPRESSOR, "chunks": tuple(CHUNKS.values())}
+                        | REFLECTANCE_ENCODING[STORAGE_DTYPE],
+                        "scene_id": {"dtype": "<U64"},
+                        "sensor": {"dtype": "<U16"},
+                        "fingerprint": {"dtype": "<U64"},
+                    },
+                )
+                action = "appended"
+        print(f"  ✓ {action} {scene['scene_id']} ({scene['time']:%Y-%m-%d})")
+
+    zarr.consolidate_metadata(str(store))
+    if cache is not None:
+        cache.record(cube_marker, cube_fingerprint)
+    return len(scenes)
+
+
+def open_cube(store: Path, decode: bool = True) -> xr.Dataset:
+    """Open a datacube with its CRS attached for rioxarray.
+
+    Args:
+        store: Path of the Zarr store
+        decode: Give float reflectance with NaN nodata. With False, int16
+                cubes come back as the stored integers, with ``_FillValue``
+                and ``reflectance_scale`` left in ``attrs``.
+    """
+    ds = xr.open_zarr(store, mask_and_scale=decode)
+    scale = ds.reflectance.attrs.get("reflectance_scale")
+    if decode and scale:
+        ds["reflectance"] = ds.reflectance / scale
+    return ds.rio.write_crs(ds.attrs["crs"]).sortby("time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append processed HLS scenes to a Zarr datacube.")
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR, help="Directory with *_processed.tif scenes")
+    parser.add_argument("--store", type=Path, default=None, help="Zarr store (default: <data-dir>/hls_cube.zarr)")
+    parser.add_argument("--no-cache", action="store_true", help="Skip scenes already in the cube by id only")
+    args = parser.parse_args()
+
+    store = args.store or args.data_dir / "hls_cube.zarr"
+    processed = cube_inputs(args.data_dir)
+    print(f"Appending up to {len(processed)} scenes to {store}...")
+    n = append_scenes(processed, store, cache=None if args.no_cache else BuildCache(BUILD_CACHE_PATH))
+    print(f"Appended or rewrote {n} scenes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,476 @@
+"""
+Local stand-in for the Planetary Computer STAC API and HLS COG assets.
+
+Serves a STAC item-search endpoint and synthetic HLS Cloud-Optimized
+GeoTIFFs with HTTP range-request support, with configurable latency,
+bandwidth and error injection, so the acquisition path can be benchmarked
+offline and reproducibly.
+"""
+import argparse
+import json
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from rasterio.warp import transform, transform_bounds
+
+from config import BANDS, BBOX, HLS_CRS
+
+RESOLUTION = 30  # metres, as HLS
+COG_BLOCK_SIZE = 256
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def make_cog(path: Path, transform_, size: int, seed: int, scale: float = 0.0001):
+    """Write a synthetic int16 HLS-like band as a COG."""
+    rng = np.random.default_rng(seed)
+    # smooth field plus noise so compression behaves like real imagery
+    y, x = np.mgrid[0:size, 0:size] / size
+    data = 1500 + 1000 * np.sin(6 * x + seed) * np.cos(4 * y) + rng.normal(0, 50, (size, size))
+    data = data.astype(np.int16)
+
+    profile = {
+        "driver": "COG",
+        "width": size,
+        "height": size,
+        "count": 1,
+        "dtype": "int16",
+        "crs": HLS_CRS,
+        "transform": transform_,
+        "nodata": -9999,
+        "compress": "deflate",
+        "blocksize": COG_BLOCK_SIZE,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+        dst.scales = (scale,)
+        dst.offsets = (0.0,)
+
+
+def build_catalog(
+    root: Path,
+    bbox: list[float] = BBOX,
+    n_tiles: int = 2,
+    n_dates: int = 4,
+    tile_size: int = 1830,
+    collections: dict = BANDS,
+) -> list[dict]:
+    """Generate COG assets and STAC item dicts covering ``bbox``.
+
+    ``n_tiles`` side-by-side tiles (with ~10% overlap, like adjacent MGRS
+    tiles) are created once per band and shared by ``n_dates`` acquisitions
+    per collection. Asset hrefs are relative (``/assets/...``) and completed
+    with the server URL when served.
+
+    Args:
+        root: Directory the COGs are written to
+        bbox: Area the tiles are centred on, in EPSG:4326
+        n_tiles: Number of adjacent tiles
+        n_dates: Acquisition dates per collection
+        tile_size: Tile width and height in pixels
+        collections: Bands per collection id
+
+    Returns:
+        List of STAC item dicts
+    """
+    root.mkdir(parents=True, exist_ok=True)
+    cx, cy = transform("EPSG:4326", HLS_CRS, [(bbox[0] + bbox[2]) / 2], [(bbox[1] + bbox[3]) / 2])
+    extent = tile_size * RESOLUTION
+    step = int(extent * 0.9)
+    left0 = cx[0] - (step * (n_tiles - 1) + extent) / 2
+    top = cy[0] + extent / 2
+
+    tiles = []
+    for t in range(n_tiles):
+        left = left0 + t * step
+        tile_transform = from_origin(left, top, RESOLUTION, RESOLUTION)
+        bounds = transform_bounds(HLS_CRS, "EPSG:4326", left, top - extent, left + extent, top)
+        tiles.append((f"T15TV{chr(ord('A') + t)}", tile_transform, bounds))
+
+    all_bands = sorted({band for bands in collections.values() for band in bands})
+    for tile_id, tile_transform, _ in tiles:
+        for b, band in enumerate(all_bands):
+            path = root / f"{tile_id}_{band}.tif"
+            if not path.exists():
+                make_cog(path, tile_transform, tile_size, seed=b)
+
+    start = datetime(2023, 5, 1, 17, 0, tzinfo=timezone.utc)
+    items = []
+    for c, (collection, bands) in enumerate(collections.items()):
+        sensor = collection.split("-")[-1].upper()
+        for d in range(n_dates):
+            when = start + timedelta(days=8 * d + c)
+            for t, (tile_id, _, (w, s, e, n)) in enumerate(tiles):
+                item_id = f"HLS.{sensor}.{tile_id}.{when.strftime('%Y%jT%H%M%S')}.v2.0"
+                items.append(
+                    {
+                        "type": "Feature",
+                        "stac_version": "1.0.0",
+                        "stac_extensions": [],
+                        "id": item_id,
+                        "collection": collection,
+                        "bbox": [w, s, e, n],
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [[[w, s], [e, s], [e, n], [w, n], [w, s]]],
+                        },
+                        "properties": {
+                            "datetime": when.isoformat().replace("+00:00", "Z"),
+                            "eo:cloud_cover": float((d * 7 + t) % 3),
+                        },
+                        "links": [],
+                        "assets": {
+                            band: {
+                                "href": f"/assets/{tile_id}_{band}.tif",
+                                "type": "image/tiff; application=geotiff; profile=cloud-optimized",
+                                "roles": ["data"],
+                            }
+                            for band in bands
+                        },
+                    }
+                )
+    return items
+
+
+def _parse_datetime(value: str) -> datetime | None:
+    if value in ("", ".."):
+        return None
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def filter_items(items: list[dict], params: dict) -> list[dict]:
+    """Apply the subset of STAC item-search filters the repo uses."""
+    collections = params.get("collections")
+    if isinstance(collections, str):
+        collections = collections.split(",")
+    bbox = params.get("bbox")
+    if isinstance(bbox, str):
+        bbox = [float(v) for v in bbox.split(",")]
+    interval = params.get("datetime")
+    query = params.get("query") or {}
+    if isinstance(query, str):
+        query = json.loads(query)
+
+    selected = []
+    for item in items:
+        if collections and item["collection"] not in collections:
+            continue
+        if bbox:
+            w, s, e, n = item["bbox"]
+            if w > bbox[2] or e < bbox[0] or s > bbox[3] or n < bbox[1]:
+                continue
+        if interval:
+            when = _parse_datetime(item["properties"]["datetime"])
+            start, _, end = interval.partition("/")
+            start, end = _parse_datetime(start), _parse_datetime(end or start)
+            if (start and when < start) or (end and when > end):
+                continue
+        ok = True
+        for prop, ops in query.items():
+            value = item["properties"].get(prop)
+            if "lte" in ops and not value <= ops["lte"]:
+                ok = False
+            if "gte" in ops and not value >= ops["gte"]:
+                ok = False
+        if ok:
+            selected.append(item)
+    return selected
+
+
+class FixtureServer:
+    """Threaded HTTP server for STAC search and COG assets.
+
+    Args:
+        root: Directory for generated COGs; a temporary one if None
+        port: Port to listen on; 0 picks a free port
+        latency: Seconds added before every response
+        bandwidth: Bytes per second per asset response, or None for unlimited
+        error_rate: Fraction of requests answered with 503 and Retry-After
+        throttle_rate: Fraction of requests answered with 429 and Retry-After
+        page_size: Default number of items per search page
+        seed: Seed for error injection
+        **catalog_kwargs: Passed to build_catalog
+    """
+
+    def __init__(
+        self,
+        root: str | Path | None = None,
+        port: int = 0,
+        latency: float = 0.0,
+        bandwidth: float | None = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        page_size: int = 10,
+        seed: int = 0,
+        **catalog_kwargs,
+    ):
+        self._tmpdir = None
+        if root is None:
+            self._tmpdir = tempfile.mkdtemp(prefix="stac_fixture_")
+            root = self._tmpdir
+        self.root = Path(root)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+        self.items = build_catalog(self.root, **catalog_kwargs)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._tmpdir:
+            shutil.rmtree(self._tmpdir, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _inject_fault(self) -> int | None:
+        with self._lock:
+            self.requests += 1
+            draw = self.random.random()
+        if draw < self.throttle_rate:
+            return 429
+        if draw < self.throttle_rate + self.error_rate:
+            return 503
+        return None
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send_json(self, body: dict, status: int = 200):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _fault(self) -> bool:
+                time.sleep(server.latency)
+                status = server._inject_fault()
+                if status is None:
+                    return False
+                self.send_response(status)
+                self.send_header("Retry-After", "1")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return True
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path.startswith("/assets/"):
+                    return self._asset(parsed.path[len("/assets/"):], head=False)
+                if self._fault():
+                    return
+                if parsed.path in ("", "/"):
+                    return self._landing()
+                if parsed.path == "/search":
+                    params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                    return self._search(params)
+                self._send_json({"code": "NotFound"}, 404)
+
+            def do_HEAD(self):
+                parsed = urlparse(self.path)
+                if parsed.path.startswith("/assets/"):
+                    return self._asset(parsed.path[len("/assets/"):], head=True)
+                self.send_response(405)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                params = json.loads(self.rfile.read(length) or b"{}")
+                if self._fault():
+                    return
+                if urlparse(self.path).path == "/search":
+                    return self._search(params)
+                self._send_json({"code": "NotFound"}, 404)
+
+            def _landing(self):
+                self._send_json(
+                    {
+                        "type": "Catalog",
+                        "id": "fixture",
+                        "description": "Local STAC fixture",
+                        "stac_version": "1.0.0",
+                        "conformsTo": [
+                            "https://api.stacspec.org/v1.0.0/core",
+                            "https://api.stacspec.org/v1.0.0/item-search",
+                            "https://api.stacspec.org/v1.0.0/item-search#query",
+                        ],
+                        "links": [
+                            {"rel": "self", "href": f"{server.url}/", "type": "application/json"},
+                            {"rel": "root", "href": f"{server.url}/", "type": "application/json"},
+                            {"rel": "search", "href": f"{server.url}/search", "type": "application/geo+json", "method": "GET"},
+                            {"rel": "search", "href": f"{server.url}/search", "type": "application/geo+json", "method": "POST"},
+                        ],
+                    }
+                )
+
+            def _search(self, params: dict):
+                matches = filter_items(server.items, params)
+                limit = int(params.get("limit") or server.page_size)
+                offset = int(params.get("token") or 0)
+                page = matches[offset:offset + limit]
+
+                features = []
+                for item in page:
+                    item = json.loads(json.dumps(item))
+                    for asset in item["assets"].values():
+                        asset["href"] = server.url + asset["href"]
+                    features.append(item)
+
+                links = []
+                if offset + limit < len(matches):
+                    body = {**params, "token": str(offset + limit)}
+                    links.append(
+                        {
+                            "rel": "next",
+                            "href": f"{server.url}/search",
+                            "type": "application/geo+json",
+                            "method": "POST",
+                            "body": body,
+                        }
+                    )
+                self._send_json(
+                    {
+                        "type": "FeatureCollection",
+                        "features": features,
+                        "links": links,
+                        "numberMatched": len(matches),
+                        "numberReturned": len(features),
+                    }
+                )
+
+            def _asset(self, name: str, head: bool):
+                path = server.root / Path(name).name
+                if not path.exists():
+                    self.send_response(404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                if self._fault():
+                    return
+
+                size = path.stat().st_size
+                start, end = 0, size - 1
+                status = 200
+                match = re.match(r"bytes=(\d*)-(\d*)", self.headers.get("Range", ""))
+                if match:
+                    first, last = match.groups()
+                    if first:
+                        start = int(first)
+                        end = min(int(last), size - 1) if last else size - 1
+                    else:
+                        # suffix range: the last N bytes
+                        start = max(size - int(last), 0)
+                    if start >= size:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{size}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    status = 206
+
+                length = end - start + 1
+                self.send_response(status)
+                self.send_header("Content-Type", "image/tiff")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(length))
+                if status == 206:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+                self.end_headers()
+                if head:
+                    return
+
+                with open(path, "rb") as f:
+                    f.seek(start)
+                    remaining = length
+                    while remaining > 0:
+                        chunk = f.read(min(STREAM_CHUNK_SIZE, remaining))
+                        if not chunk:
+                            break
+                        try:
+                            self.wfile.write(chunk)
+                        except (BrokenPipeError, ConnectionResetError):
+                            return
+                        remaining -= len(chunk)
+                        with server._lock:
+                            server.bytes_sent += len(chunk)
+                        if server.bandwidth:
+                            time.sleep(len(chunk) / server.bandwidth)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a local STAC + COG fixture catalog.")
+    parser.add_argument("--root", default=None, help="Directory for generated COGs (temporary if omitted)")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to each response")
+    parser.add_argument("--bandwidth", type=float, default=None, help="Bytes per second per asset response")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 503 responses")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of 429 responses")
+    parser.add_argument("--tiles", type=int, default=2, help="Adjacent tiles")
+    parser.add_argument("--dates", type=int, default=4, help="Acquisition dates per collection")
+    parser.add_argument("--tile-size", type=int, default=1830, help="Tile size in pixels")
+    args = parser.parse_args()
+
+    server = FixtureServer(
+        root=args.root,
+        port=args.port,
+        latency=args.latency,
+        bandwidth=args.bandwidth,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        n_tiles=args.tiles,
+        n_dates=args.dates,
+        tile_size=args.tile_size,
+    )
+    print(f"Serving {len(server.items)} items at {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
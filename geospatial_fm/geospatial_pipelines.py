@@ -103,7 +103,9 @@ class TorchRandomCrop(object):
 class TorchNormalize(object):
     """Normalize the image.
 
-    It normalises a multichannel image using torch
+    It normalises a multichannel image using torch. Integer images (e.g.
+    int16 scaled reflectance) are converted to float here, so they stay
+    compact through loading and only this step dequantises them.
 
     Args:
         mean (sequence): Mean values .
@@ -124,7 +126,10 @@ class TorchNormalize(object):
             dict: Normalized results, 'img_norm_cfg' key is added into
                 result dict.
         """
-        results["img"] = F.normalize(results["img"], self.means, self.stds, False)
+        img = results["img"]
+        if not img.is_floating_point():
+            img = img.float()
+        results["img"] = F.normalize(img, self.means, self.stds, False)
         results["img_norm_cfg"] = dict(mean=self.means, std=self.stds)
         return results
 
@@ -148,13 +153,15 @@ class Reshape(object):
         dim_to_infer = np.where(np.array(self.new_shape) == -1)[0]
 
         for key in self.keys:
+            # inferred per image, so one composed pipeline serves any image size
+            new_shape = self.new_shape
             if (len(dim_to_infer) > 1) & (self.look_up is not None):
                 old_shape = results[key].shape
                 tmp = np.array(self.new_shape)
                 for i in range(len(dim_to_infer)):
                     tmp[dim_to_infer[i]] = old_shape[self.look_up[str(dim_to_infer[i])]]
-                self.new_shape = tuple(tmp)
-            results[key] = results[key].reshape(self.new_shape)
+                new_shape = tuple(tmp)
+            results[key] = results[key].reshape(new_shape)
 
         return results
 
@@ -70,49 +70,59 @@ class TemporalEncoderDecoder(EncoderDecoder):
             align_corners=self.align_corners)
         return out
       
+    def slide_windows(self, h_img, w_img):
+        """(y1, y2, x1, x2) of every sliding window over an image, row by row."""
+        h_stride, w_stride = self.test_cfg.stride
+        h_crop, w_crop = self.test_cfg.crop_size
+        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
+        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
+        windows = []
+        for h_idx in range(h_grids):
+            for w_idx in range(w_grids):
+                y1 = h_idx * h_stride
+                x1 = w_idx * w_stride
+                y2 = min(y1 + h_crop, h_img)
+                x2 = min(x1 + w_crop, w_img)
+                y1 = max(y2 - h_crop, 0)
+                x1 = max(x2 - w_crop, 0)
+                windows.append((y1, y2, x1, x2))
+        return windows
+
     def slide_inference(self, img, img_meta, rescale):
         """Inference by sliding-window with overlap.
 
         If h_crop > h_img or w_crop > w_img, the small patch will be used to
         decode without padding.
+
+        Windows all have the same size, so up to ``test_cfg.crop_batch_size``
+        of them (default 1) are stacked along the batch dimension and run
+        through the backbone, neck and head in one forward pass.
         """
 
-        h_stride, w_stride = self.test_cfg.stride
-        h_crop, w_crop = self.test_cfg.crop_size
-        
+        crop_batch_size = self.test_cfg.get('crop_batch_size', 1)
+
         #### size and bactch size over last two dimensions ###
         img_size = img.size()
         batch_size = img_size[0]
         h_img = img_size[-2]
         w_img = img_size[-1]
         out_channels = self.out_channels
-        h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
-        w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
         preds = img.new_zeros((batch_size, out_channels, h_img, w_img))
         count_mat = img.new_zeros((batch_size, 1, h_img, w_img))
-        for h_idx in range(h_grids):
-            for w_idx in range(w_grids):
-                y1 = h_idx * h_stride
-                x1 = w_idx * w_stride
-                y2 = min(y1 + h_crop, h_img)
-                x2 = min(x1 + w_crop, w_img)
-                y1 = max(y2 - h_crop, 0)
-                x1 = max(x2 - w_crop, 0)
-                
-                if len(img_size) == 4:
-                    
-                    crop_img = img[:, :, y1:y2, x1:x2]
-                
-                elif len(img_size) == 5:
-                    
-                    crop_img = img[:, :, :, y1:y2, x1:x2]
-                
-                
-                
-                crop_seg_logit = self.encode_decode(crop_img, img_meta)
-                preds += F.pad(crop_seg_logit,
-                               (int(x1), int(preds.shape[3] - x2), int(y1),
-                                int(preds.shape[2] - y2)))
+        windows = self.slide_windows(h_img, w_img)
+        for start in range(0, len(windows), crop_batch_size):
+            group = windows[start:start + crop_batch_size]
+            # ellipsis covers both (N, C, H, W) and (N, C, T, H, W) inputs
+            crop_img = torch.cat([img[..., y1:y2, x1:x2] for y1, y2, x1, x2 in group])
+            crop_seg_logits = self.encode_decode(crop_img, img_meta).split(batch_size)
+
+            for (y1, y2, x1, x2), crop_seg_logit in zip(group, crop_seg_logits):
+                if torch.onnx.is_in_onnx_export():
+                    preds += F.pad(crop_seg_logit,
+                                   (int(x1), int(preds.shape[3] - x2), int(y1),
+                                    int(preds.shape[2] - y2)))
+                else:
+                    preds[:, :, y1:y2, x1:x2] += crop_seg_logit
 
                 count_mat[:, :, y1:y2, x1:x2] += 1
         assert (count_mat == 0).sum() == 0
@@ -1,35 +1,356 @@
-import requests
+import hashlib
+import json
+import math
+import threading
+import time
+from contextlib import nullcontext
+from concurrent.futures import FIRST_COMPLETED, as_completed, wait
 from pathlib import Path
-from typing import List, Dict
+from typing import Dict, Iterable, List
+from urllib.parse import urlparse
 
+import rasterio
+import requests
+from requests.adapters import HTTPAdapter
 from pystac import Item
+from rasterio.errors import RasterioIOError
+from rasterio.warp import transform_bounds
+from rasterio.windows import Window, from_bounds
 
+from manifest import Manifest, file_sha256
+from telemetry import TransferLog
+from throttle import DownloadScheduler, IncompleteTransfer, RetryPolicy
 
-def download_items(
-    items_dict: Dict[str, List[Item]],
+CHUNK_SIZE = 1024 * 1024  # bytes per streamed write
+WINDOW_TAG = "WINDOW_BBOX"  # GeoTIFF tag recording the bbox a windowed file was cut to
+
+# GDAL settings for reading remote COGs with as few requests as possible
+COG_READ_OPTIONS = {
+    "GDAL_DISABLE_READDIR_ON_OPEN": "EMPTY_DIR",
+    "GDAL_HTTP_MERGE_CONSECUTIVE_RANGES": "YES",
+    "GDAL_HTTP_MULTIPLEX": "YES",
+    "GDAL_INGESTED_BYTES_AT_OPEN": 32768,
+    "VSI_CACHE": "TRUE",
+    "GDAL_HTTP_MAX_RETRY": 3,
+    "GDAL_HTTP_RETRY_DELAY": 1,
+}
+
+
+class HostLimiter:
+    """Cap the number of in-flight requests per host.
+
+    Each host gets its own bounded semaphore, created on first use, so a slow
+    or throttling endpoint cannot take every worker in the pool.
+
+    Args:
+        max_per_host: Maximum concurrent requests against a single host
+    """
+
+    def __init__(self, max_per_host: int = 4):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+
+def make_session(pool_size: int = 8) -> requests.Session:
+    """Create a requests session with a keep-alive connection pool.
+
+    Args:
+        pool_size: Number of connections kept open per host
+
+    Returns:
+        Session shared by all download workers
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _range_total(response: requests.Response) -> int | None:
+    """Total size from a ``Content-Range`` header, or None if absent or unknown."""
+    content_range = response.headers.get("content-range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        if total != "*":
+            return int(total)
+    return None
+
+
+def _expected_size(response: requests.Response, offset: int) -> int | None:
+    """Total size of the remote file, or None if the server does not say."""
+    total = _range_total(response)
+    if total is not None:
+        return total
+    content_length = response.headers.get("content-length")
+    if content_length is not None:
+        return offset + int(content_length)
+    return None
+
+
+def download_file(
+    session: requests.Session,
+    url: str,
+    filename: Path,
+    host_limiter: HostLimiter = None,
+    timeout: float | tuple[float, float] = (10, 60),
+    chunk_size: int = CHUNK_SIZE,
+) -> tuple[int, str]:
+    """Stream a single asset to disk, resuming a partial download if present.
+
+    The body is written in chunks to ``<filename>.part``. If that file already
+    exists, an HTTP Range request asks for the remaining bytes only. The part
+    file is renamed into place once its size matches the size reported by the
+    server, so ``filename`` only ever exists when complete. If the server
+    rejects the range (416), the part file is kept only when the
+    ``Content-Range`` total confirms it is complete; otherwise it is deleted
+    and the download restarts from the first byte, once.
+
+    Args:
+        session: Shared HTTP session
+        url: Asset URL
+        filename: Destination path
+        host_limiter: Optional per-host concurrency limiter
+        timeout: Request timeout in seconds, or a (connect, read) tuple. The
+                 read timeout bounds the gap between bytes, not the transfer.
+        chunk_size: Bytes read from the socket per write
+
+    Returns:
+        Tuple of (bytes transferred, SHA-256 of the complete file)
+    """
+    part = filename.with_name(filename.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+    digest = hashlib.sha256()
+
+    # identity encoding keeps the byte count comparable to content-length
+    headers = {"Accept-Encoding": "identity"}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    limiter = host_limiter(url) if host_limiter is not None else nullcontext()
+    with limiter:
+        response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        if response.status_code == 416 and offset:
+            total = _range_total(response)
+            response.close()
+            if total == offset:
+                # part file already holds every byte
+                part.replace(filename)
+                return 0, file_sha256(filename)
+            # part file is longer than the remote file, the object changed or
+            # the server did not say: drop it and fetch from the start
+            part.unlink()
+            offset = 0
+            del headers["Range"]
+            response = session.get(url, headers=headers, stream=True, timeout=timeout)
+
+        with response:
+            response.raise_for_status()
+
+            if offset and response.status_code != 206:
+                # server ignored the Range header and sent the whole body
+                offset = 0
+            expected = _expected_size(response, offset)
+
+            if offset:
+                # bytes already on disk are part of the checksum
+                with open(part, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        digest.update(chunk)
+
+            transferred = 0
+            with open(part, "ab" if offset else "wb") as f:
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    transferred += len(chunk)
+
+    size = part.stat().st_size
+    if expected is not None and size != expected:
+        raise IncompleteTransfer(f"incomplete transfer, {size} of {expected} bytes on disk")
+    part.replace(filename)
+    return transferred, digest.hexdigest()
+
+
+def block_aligned_window(window: Window, block_shape: tuple[int, int], height: int, width: int) -> Window:
+    """Expand a window outward to the dataset's internal block grid.
+
+    Reading whole blocks means every tile GDAL fetches is used in full and no
+    tile is requested twice by neighbouring windows.
+
+    Args:
+        window: Pixel window to expand
+        block_shape: (rows, cols) of the internal tiles
+        height: Dataset height in pixels
+        width: Dataset width in pixels
+
+    Returns:
+        Integer window covering ``window``, clamped to the dataset extent
+    """
+    block_rows, block_cols = block_shape
+    row_start = max(int(math.floor(window.row_off / block_rows)) * block_rows, 0)
+    col_start = max(int(math.floor(window.col_off / block_cols)) * block_cols, 0)
+    row_stop = min(int(math.ceil((window.row_off + window.height) / block_rows)) * block_rows, height)
+    col_stop = min(int(math.ceil((window.col_off + window.width) / block_cols)) * block_cols, width)
+    return Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+
+
+def download_window(
+    url: str,
+    filename: Path,
+    bbox: list[float],
+    host_limiter: HostLimiter = None,
+) -> tuple[int, str]:
+    """Copy only the part of a remote COG that intersects a bounding box.
+
+    GDAL reads the COG header and then fetches just the internal tiles covering
+    ``bbox`` with HTTP range requests. The window is written to a local tiled
+    GeoTIFF with the source's georeferencing, nodata and tags, plus a
+    ``WINDOW_BBOX`` tag recording ``bbox`` so a later run with a different
+    bbox can tell the crop is stale (see ``window_matches``).
+
+    Args:
+        url: HTTP(S) URL of a Cloud-Optimized GeoTIFF
+        filename: Destination path
+        bbox: Bounding box in EPSG:4326 [minx, miny, maxx, maxy]
+        host_limiter: Optional per-host concurrency limiter
+
+    Returns:
+        Tuple of (size of the local GeoTIFF written, SHA-256 of that file).
+        The size is not the number of bytes read over the network, which
+        rasterio does not expose.
+    """
+    part = filename.with_name(filename.name + ".part")
+
+    limiter = host_limiter(url) if host_limiter is not None else nullcontext()
+    with limiter, rasterio.Env(**COG_READ_OPTIONS), rasterio.open(url) as src:
+        bounds = transform_bounds("EPSG:4326", src.crs, *bbox)
+        window = from_bounds(*bounds, transform=src.transform)
+        window = window.intersection(Window(0, 0, src.width, src.height))
+        window = block_aligned_window(window, src.block_shapes[0], src.height, src.width)
+
+        data = src.read(window=window)
+        profile = src.profile.copy()
+        profile.update(
+            driver="GTiff",
+            height=window.height,
+            width=window.width,
+            transform=src.window_transform(window),
+        )
+        tags = src.tags()
+
+        with rasterio.open(part, "w", **profile) as dst:
+            dst.write(data)
+            dst.update_tags(**tags, **{WINDOW_TAG: json.dumps(list(bbox))})
+
+    part.replace(filename)
+    return filename.stat().st_size, file_sha256(filename)
+
+
+def window_matches(filename: Path, bbox: list[float] | None) -> bool:
+    """Whether a local GeoTIFF was cut to ``bbox`` (None: the full asset)."""
+    try:
+        with rasterio.open(filename) as src:
+            tag = src.tags().get(WINDOW_TAG)
+    except RasterioIOError:
+        return False
+    return (json.loads(tag) if tag else None) == (list(bbox) if bbox is not None else None)
+
+
+def is_geotiff(asset) -> bool:
+    """Whether a STAC asset is a GeoTIFF that supports windowed reads."""
+    media_type = asset.media_type or ""
+    return "geotiff" in media_type or urlparse(asset.href).path.lower().endswith((".tif", ".tiff"))
+
+
+def download_stream(
+    items: Iterable[Item],
     collection_name: str,
     output_dir: None | str = None,
     band_names: Dict[str, List[str]] = None,
+    max_workers: int = 8,
+    max_per_host: int = 4,
+    bbox: list[float] = None,
+    total: int | None = None,
+    start_time: float | None = None,
+    manifest: Manifest | None = None,
+    rate_limit: float | None = None,
+    max_attempts: int = 5,
+    timeout: float | tuple[float, float] = (10, 60),
+    telemetry: TransferLog | None = None,
 ) -> Dict[str, int]:
     """
-    Download specified bands from STAC items to local directory.
+    Download specified bands from a stream of STAC items to local directory.
+
+    Items are consumed as they arrive, so downloads can start while a search
+    is still paging. Band files are fetched concurrently by a thread pool
+    sharing one keep-alive session, so throughput scales with the number of
+    workers rather than with request round-trip latency. At most
+    ``2 * max_workers`` transfers are queued at a time; beyond that, pulling
+    the next item waits for a transfer to finish, which back-pressures the
+    producer.
+
+    Transfers run through a DownloadScheduler: requests are rate limited by a
+    token bucket, transient failures (429, 5xx, dropped connections) are
+    retried with exponential backoff or after Retry-After, and concurrency is
+    lowered on throttling and raised again while requests succeed.
+
+    If ``bbox`` is given, GeoTIFF assets are not downloaded in full: only the
+    internal COG tiles intersecting the box are read and written locally.
+    Other assets (e.g. thumbnails) are still downloaded whole.
+
+    With a ``manifest``, an asset is only skipped if the manifest records it
+    and the file on disk has the recorded size; every completed download is
+    recorded with its checksum. Without one, any existing file is skipped.
+    Either way, an existing GeoTIFF is fetched again if it was cut to a
+    different bbox than the current one (or cut when a full file is wanted).
 
     Args:
-        items_dict: Dictionary of STAC items to download, keyed by collection name
+        items: Iterable of STAC items to download
         collection_name: Name of collection (e.g., 'sentinel-2-l2a', 'landsat-c2-l2')
         output_dir: Root output directory for downloads
         band_names: List of band names to download (e.g., ['B02', 'B03', 'B04', 'B08', 'B11', 'B12'] for S2)
                    If None, downloads all available bands
+        max_workers: Number of concurrent download threads
+        max_per_host: Maximum concurrent requests against a single host
+        bbox: Optional bounding box in EPSG:4326 [minx, miny, maxx, maxy] to
+              window GeoTIFF assets to
+        total: Number of items, if known, for progress messages
+        start_time: time.perf_counter() value that timings are measured from.
+                    Defaults to the time of the call.
+        manifest: Optional download manifest used to skip and record assets
+        rate_limit: Maximum sustained file transfers started per second, or
+                    None for no limit
+        max_attempts: Attempts per file before it counts as failed
+        timeout: Request timeout in seconds, or a (connect, read) tuple
+        telemetry: Optional transfer log receiving per-file timings and sizes
 
     Returns:
-        Dictionary with download statistics
+        Dictionary with download statistics, including bytes transferred,
+        effective MB/s, the wall time and the time to the first completed file
     """
+    start_time = time.perf_counter() if start_time is None else start_time
     stats = {
-        "total_items": sum(len(items) for items in items_dict.values()),
+        "total_items": 0,
         "downloaded": 0,
         "failed": 0,
         "skipped": 0,
         "files_downloaded": 0,
+        "retries": 0,
+        "throttled": 0,
+        "bytes_transferred": 0,
+        "bytes_written_windowed": 0,
+        "mb_per_s": None,
+        "time_to_first_file": None,
+        "wall_time": None,
     }
 
     # Create output directory structure
@@ -39,84 +360,158 @@ def download_items(
     print(f"\nDownloading {collection_name} items to {base_path}")
     print("-" * 70)
 
-    # flatten the nested lists in items
-    items = []
-    for item_list in items_dict.values():
-        items.extend(item_list)
+    session = make_session(pool_size=max_workers)
+    host_limiter = HostLimiter(max_per_host)
+
+    # bands that completed, keyed by item id
+    bands_downloaded = {}
+    futures = {}
+    recorded = manifest.sizes() if manifest is not None else {}
+
+    def is_complete(item, band, filename):
+        if manifest is None:
+            return filename.exists()
+        size = recorded.get((item.id, band))
+        return size is not None and filename.exists() and filename.stat().st_size == size
+
+    def file_done():
+        if stats["time_to_first_file"] is None:
+            stats["time_to_first_file"] = round(time.perf_counter() - start_time, 3)
+        stats["files_downloaded"] += 1
 
-    for idx, item in enumerate(items, 1):
-        item_date = item.datetime.strftime("%Y-%m-%d") if item.datetime else "unknown"
-        item_path = base_path / item.id
-        item_path.mkdir(parents=True, exist_ok=True)
-
-        print(f"[{idx}/{len(items)}] {item.id} ({item_date})")
-
-        try:
-            # Determine collection ID from item or collection name
-            collection_id = (
-                item.collection_id if hasattr(item, "collection_id") else None
-            )
-            if not collection_id and "s30" in collection_name:
-                collection_id = "hls2-s30"
-            elif not collection_id and "l30" in collection_name:
-                collection_id = "hls2-l30"
-
-            # Get available assets
-            available_bands = list(item.assets.keys())
-
-            # Filter to requested bands if specified
-            if band_names:
-                bands_to_download = band_names[collection_id]
-            else:
-                bands_to_download = available_bands
-
-            # Check if any requested bands are not available
-            unavailable_bands = [band for band in bands_to_download if band not in available_bands]
-            if unavailable_bands:
-                print(f"      ⊘ Requested bands not available: {unavailable_bands}. Available: {available_bands}")
-
-            if not bands_to_download:
-                print(f"      ⊘ No requested bands found. Available: {available_bands}")
-                stats["skipped"] += 1
-                continue
-
-            # Download each band
-            bands_downloaded = []
-            for requested_band in bands_to_download:
-
-                asset = item.assets[requested_band]
-                url = asset.href
-
-                # Sign the URL with Planetary Computer credentials
-                # signed_url = planetary_computer.sign_url(url)
-
-                filename = item_path / f"{requested_band}.tif"
-
-                if filename.exists():
-                    print(f"      ✓ {requested_band} (exists)")
-                    stats["files_downloaded"] += 1
-                    bands_downloaded.append(requested_band)
+    def timed(fn, url):
+        # per-attempt timing; only the successful attempt's time is returned.
+        # The host slot is taken here, before the clock starts, so time spent
+        # queueing behind the per-host limit is not counted as transfer time.
+        def wrapper(*args):
+            with host_limiter(url):
+                start = time.perf_counter()
+                result = fn(*args)
+                return result, time.perf_counter() - start
+        return wrapper
+
+    def collect(done):
+        for future in done:
+            item, requested_band, filename, window = futures.pop(future)
+            item_id = item.id
+            try:
+                (n_bytes, sha256), seconds = future.result()
+                if window is None:
+                    print(f"      ✓ {item_id} {requested_band} ({n_bytes} bytes, {seconds:.1f} s)")
+                    stats["bytes_transferred"] += n_bytes
+                    if telemetry is not None:
+                        telemetry.record(item_id, item.collection_id, requested_band, seconds, n_bytes)
                 else:
-                    try:
-                        response = requests.get(url, timeout=30)
-                        response.raise_for_status()
-                        with open(filename, "wb") as f:
-                            f.write(response.content)
-                        print(
-                            f"      ✓ {requested_band} ({response.headers.get('content-length', '?')} bytes)"
+                    # windowed reads report the size written, not bytes received
+                    print(f"      ✓ {item_id} {requested_band} ({n_bytes} bytes written, {seconds:.1f} s)")
+                    stats["bytes_written_windowed"] += n_bytes
+                    if telemetry is not None:
+                        telemetry.record(
+                            item_id, item.collection_id, requested_band, seconds, None, output_bytes=n_bytes
                         )
-                        stats["files_downloaded"] += 1
-                        bands_downloaded.append(requested_band)
-                    except Exception as e:
-                        print(f"      ✗ {requested_band} failed: {e}")
-                        stats["failed"] += 1
+                if manifest is not None:
+                    manifest.record(item, requested_band, filename, sha256, window=window)
+                file_done()
+                bands_downloaded[item_id].append(requested_band)
+            except Exception as e:
+                print(f"      ✗ {item_id} {requested_band} failed: {e}")
+                stats["failed"] += 1
+                if telemetry is not None:
+                    telemetry.record(item_id, item.collection_id, requested_band, 0.0, 0, ok=False)
+
+    scheduler = DownloadScheduler(
+        max_workers=max_workers,
+        rate=rate_limit,
+        retry=RetryPolicy(max_attempts=max_attempts),
+    )
+    transfer_phase = telemetry.phase("transfer") if telemetry is not None else nullcontext()
+    with transfer_phase, scheduler:
+        for idx, item in enumerate(items, 1):
+            stats["total_items"] += 1
+            item_date = item.datetime.strftime("%Y-%m-%d") if item.datetime else "unknown"
+            item_path = base_path / item.id
+            item_path.mkdir(parents=True, exist_ok=True)
+
+            print(f"[{idx}/{total or '?'}] {item.id} ({item_date})")
+
+            try:
+                # Determine collection ID from item or collection name
+                collection_id = (
+                    item.collection_id if hasattr(item, "collection_id") else None
+                )
+                if not collection_id and "s30" in collection_name:
+                    collection_id = "hls2-s30"
+                elif not collection_id and "l30" in collection_name:
+                    collection_id = "hls2-l30"
+
+                # Get available assets
+                available_bands = list(item.assets.keys())
+
+                # Filter to requested bands if specified
+                if band_names:
+                    bands_to_download = band_names[collection_id]
+                else:
+                    bands_to_download = available_bands
 
-            if bands_downloaded:
-                stats["downloaded"] += 1
+                # Check if any requested bands are not available
+                unavailable_bands = [band for band in bands_to_download if band not in available_bands]
+                if unavailable_bands:
+                    print(f"      ⊘ Requested bands not available: {unavailable_bands}. Available: {available_bands}")
+
+                if not bands_to_download:
+                    print(f"      ⊘ No requested bands found. Available: {available_bands}")
+                    stats["skipped"] += 1
+                    continue
+
+                bands_downloaded[item.id] = []
+                for requested_band in bands_to_download:
+
+                    asset = item.assets[requested_band]
+                    url = asset.href
+
+                    # Sign the URL with Planetary Computer credentials
+                    # signed_url = planetary_computer.sign_url(url)
+
+                    filename = item_path / f"{requested_band}.tif"
+
+                    windowed = bbox is not None and is_geotiff(asset)
+                    if is_complete(item, requested_band, filename) and (
+                        not is_geotiff(asset) or window_matches(filename, bbox if windowed else None)
+                    ):
+                        print(f"      ✓ {requested_band} (exists)")
+                        file_done()
+                        bands_downloaded[item.id].append(requested_band)
+                    elif windowed:
+                        future = scheduler.submit(
+                            timed(download_window, url), url, filename, bbox
+                        )
+                        futures[future] = (item, requested_band, filename, bbox)
+                    else:
+                        future = scheduler.submit(
+                            timed(download_file, url), session, url, filename, None, timeout
+                        )
+                        futures[future] = (item, requested_band, filename, None)
 
-        except Exception as e:
-            print(f"      ✗ Item failed: {e}")
-            stats["failed"] += 1
+            except Exception as e:
+                print(f"      ✗ Item failed: {e}")
+                stats["failed"] += 1
+
+            # Keep the transfer queue short so the producer is throttled
+            while len(futures) >= 2 * max_workers:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                collect(done)
+
+        # Collect the remaining band downloads as they complete
+        collect(as_completed(list(futures)))
+
+    session.close()
+
+    stats["retries"] = scheduler.retries
+    stats["throttled"] = scheduler.throttled
+    stats["downloaded"] = sum(1 for bands in bands_downloaded.values() if bands)
+    stats["wall_time"] = round(time.perf_counter() - start_time, 3)
+    if stats["wall_time"]:
+        stats["mb_per_s"] = round(stats["bytes_transferred"] / 1e6 / stats["wall_time"], 3)
 
     print("-" * 70)
     print(
@@ -124,3 +519,36 @@ def download_items(
     )
 
     return stats
+
+
+def download_items(
+    items_dict: Dict[str, List[Item]],
+    collection_name: str,
+    output_dir: None | str = None,
+    band_names: Dict[str, List[str]] = None,
+    **kwargs,
+) -> Dict[str, int]:
+    """
+    Download specified bands from STAC items to local directory.
+
+    Args:
+        items_dict: Dictionary of STAC items to download, keyed by collection name
+        collection_name: Name of collection (e.g., 'sentinel-2-l2a', 'landsat-c2-l2')
+        output_dir: Root output directory for downloads
+        band_names: List of band names to download (e.g., ['B02', 'B03', 'B04', 'B08', 'B11', 'B12'] for S2)
+                   If None, downloads all available bands
+        **kwargs: Passed to download_stream (max_workers, max_per_host, bbox,
+                  start_time, manifest, rate_limit, max_attempts, timeout,
+                  telemetry)
+
+    Returns:
+        Dictionary with download statistics
+    """
+    # flatten the nested lists in items
+    items = []
+    for item_list in items_dict.values():
+        items.extend(item_list)
+
+    return download_stream(
+        items, collection_name, output_dir, band_names, total=len(items), **kwargs
+    )
@@ -1,6 +1,11 @@
 import os
 import time
 import argparse
+import glob
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 
 import numpy as np
@@ -16,9 +21,11 @@ from mmseg.apis import init_segmentor
 # from mmseg.datasets.pipelines import Compose, LoadImageFromFile
 from mmcv.transforms import Compose, LoadImageFromFile
 from skimage import exposure
+from tqdm import tqdm
 
 from geospatial_fm.temporal_encoder_decoder import TemporalEncoderDecoder
 from geospatial_fm.geospatial_pipelines import LoadGeospatialImageFromFile
+from onnx_backend import ONNX_MODEL, OnnxSegmentor
 
 # torch.serialization.add_safe_globals(['numpy.core.multiarray.scalar'])
 
@@ -113,6 +120,19 @@ def preprocess_example(example_list):
     return example_list
 
 
+def build_test_pipeline(model, custom_test_pipeline=None):
+    """Compose the test pipeline of a model, optionally replaced by a custom one."""
+    cfg = model.cfg
+    test_pipeline = [LoadImageFromFile()] + cfg.data.test.pipeline[1:] if custom_test_pipeline is None else custom_test_pipeline
+    return Compose(test_pipeline)
+
+
+def prepare_data(test_pipeline, imgs):
+    """Run image file(s) through a composed test pipeline."""
+    imgs = imgs if isinstance(imgs, list) else [imgs]
+    return [test_pipeline({'img_info': {'filename': img}}) for img in imgs]
+
+
 def inference_segmentor(model, imgs, custom_test_pipeline=None):
     """Inference image(s) with the segmentor.
 
@@ -124,21 +144,22 @@ def inference_segmentor(model, imgs, custom_test_pipeline=None):
     Returns:
         (list[Tensor]): The segmentation result.
     """
-    cfg = model.cfg
+    data = prepare_data(build_test_pipeline(model, custom_test_pipeline), imgs)
+    return run_model(model, data)
+
+
+def run_model(model, data):
+    """Forward already prepared pipeline outputs through the segmentor.
+
+    Args:
+        model (nn.Module): The loaded segmentor.
+        data (list[dict]): Outputs of the test pipeline, one per image.
+
+    Returns:
+        (list[Tensor]): The segmentation result.
+    """
     device = next(model.parameters()).device  # model device
-    # build the data pipeline
-    test_pipeline = [LoadImageFromFile()] + cfg.data.test.pipeline[1:] if custom_test_pipeline is None else custom_test_pipeline
-    test_pipeline = Compose(test_pipeline)
-    # prepare data
-    data = []
-    imgs = imgs if isinstance(imgs, list) else [imgs]
-    for img in imgs:
-        img_data = {'img_info': {'filename': img}}
-        img_data = test_pipeline(img_data)
-        data.append(img_data)
-    # print(data.shape)
-    
-    data = collate(data, samples_per_gpu=len(imgs))
+    data = collate(data, samples_per_gpu=len(data))
     if next(model.parameters()).is_cuda:
         # data = collate(data, samples_per_gpu=len(imgs))
         # scatter to specified GPU
@@ -171,7 +192,10 @@ def inference_on_file(target_image, model, custom_test_pipeline):
     time_taken=-1
     st = time.time()
     print('Running inference...')
-    result = inference_segmentor(model, target_image, custom_test_pipeline)
+    if isinstance(model, OnnxSegmentor):
+        result = model.predict_file(target_image)
+    else:
+        result = inference_segmentor(model, target_image, custom_test_pipeline)
     print("Output has shape: " + str(result[0].shape))
 
     ##### get metadata mask
@@ -217,19 +241,345 @@ def process_test_pipeline(custom_test_pipeline, bands=None):
     
     return custom_test_pipeline
 
-config = Config.fromfile(config_path)
-config.model.backbone.pretrained=None
-model = init_segmentor(config, ckpt, device='cpu')
-custom_test_pipeline=process_test_pipeline(model.cfg.data.test.pipeline, None)
+def load_model(config_path=config_path, ckpt=ckpt, device='cpu', quantize=None, calibration=None):
+    """Build the segmentor and its test pipeline once.
+
+    Args:
+        config_path: Model config file
+        ckpt: Checkpoint file
+        device: Torch device; quantized models run on the CPU only
+        quantize: None for FP32, or "dynamic"/"static" INT8 (see quantization.py)
+        calibration: Rasters used to calibrate "static" quantization
+
+    Returns:
+        Tuple of (model, custom_test_pipeline)
+    """
+    config = Config.fromfile(config_path)
+    config.model.backbone.pretrained=None
+    model = init_segmentor(config, ckpt, device='cpu' if quantize else device)
+    custom_test_pipeline=process_test_pipeline(model.cfg.data.test.pipeline, None)
+    if quantize:
+        from quantization import quantize_model
+        test_pipeline = build_test_pipeline(model, custom_test_pipeline)
+        images = [prepare_data(test_pipeline, str(f))[0]['img'][0] for f in calibration or []]
+        model = quantize_model(model, quantize, images)
+    return model, custom_test_pipeline
+
+
+def resolve_inputs(source):
+    """Rasters named by a file, directory, glob pattern or manifest.
+
+    A manifest is a text file with one raster path per line (relative paths
+    are taken from the manifest's directory), or a ``chips_index.geojson``
+    written by chips.py. Predictions (``*_pred.tif``) in a directory are
+    not inputs and are left out.
+    """
+    path = Path(source)
+    if path.is_dir():
+        return sorted(p for p in path.glob("*.tif") if not p.name.endswith("_pred.tif"))
+    if path.suffix in (".txt", ".lst"):
+        lines = [line.strip() for line in path.read_text().splitlines()]
+        return [path.parent / line for line in lines if line and not line.startswith("#")]
+    if path.suffix in (".geojson", ".json"):
+        import geopandas as gpd
+        index = gpd.read_file(path)
+        if index.empty:
+            return []
+        if "path" not in index.columns:
+            raise ValueError(
+                f"{path} lists no chip files; it was written with chips.py --memmap, "
+                "whose chips are in chips.npy. Re-run chips.py without --memmap to get GeoTIFF chips."
+            )
+        return [path.parent / p for p in index["path"]]
+    if path.exists():
+        return [path]
+    return sorted(Path(p) for p in glob.glob(source, recursive=True))
+
+
+def prediction_path(image, output_dir):
+    return Path(output_dir) / f"{Path(image).stem}_pred.tif"
+
+
+def is_up_to_date(output, *inputs):
+    """Whether ``output`` exists and is newer than every input; a missing input never is."""
+    if not output.exists():
+        return False
+    mtime = output.stat().st_mtime
+    return all(Path(p).exists() and Path(p).stat().st_mtime <= mtime for p in inputs)
+
+
+def write_prediction(image, result, output):
+    """Write the class map of one image as a single-band GeoTIFF with a color table.
+
+    Classes are 1-based as in CDL_COLOR_MAP; pixels that are nodata in any
+    input band are 0 (nodata).
+    """
+    with rasterio.open(image) as src:
+        meta = src.meta.copy()
+        nodata_mask = src.read_masks().min(axis=0) == 0
+    classes = (np.asarray(result[0]) + 1).astype(np.uint8)
+    classes = np.where(nodata_mask, 0, classes)
+
+    meta.update(count=1, dtype='uint8', nodata=0, driver='GTiff', compress='deflate')
+    with rasterio.open(output, 'w', **meta) as dst:
+        dst.write(classes, 1)
+        dst.write_colormap(1, class_colormap())
+    return output
+
+
+def class_colormap(color_map=CDL_COLOR_MAP):
+    """GDAL color table for 1-based class rasters, with 0 as nodata."""
+    return {c['value']: c['rgb'] for c in color_map} | {0: (0, 0, 0)}
+
+
+def window_sample(transforms, img, filename):
+    """Run one window of raw pixels (channels last) through the test transforms.
+
+    Mirrors the fields LoadGeospatialImageFromFile sets, so the rest of the
+    test pipeline sees a window exactly as it would see a whole file.
+    """
+    results = {
+        'img_info': {'filename': filename},
+        'filename': filename,
+        'ori_filename': filename,
+        'img': img,
+        'img_shape': img.shape,
+        'ori_shape': img.shape,
+        'pad_shape': img.shape,
+        'scale_factor': 1.0,
+        'flip': False,
+        'img_norm_cfg': dict(
+            mean=np.zeros(img.shape[2], dtype=np.float32),
+            std=np.ones(img.shape[2], dtype=np.float32),
+            to_rgb=False,
+        ),
+    }
+    return transforms(results)
+
+
+def tiled_inference(model, custom_test_pipeline, input_path, output_path):
+    """Sliding-window inference over a raster of any size, streamed from disk.
+
+    The model's slide windows are visited one window row at a time: the
+    input rows under the row are read, the windows are run in batches of
+    ``test_cfg.crop_batch_size`` and their logits are summed into a rolling
+    buffer one window high. Output rows that no later window overlaps are
+    written to a tiled GeoTIFF as soon as each row is done, so memory is
+    bounded by one row of windows however large the raster is.
+
+    Args:
+        model: Segmentor from ``load_model``
+        custom_test_pipeline: Test pipeline from ``load_model``
+        input_path: Multi-temporal input raster
+        output_path: Class raster to write (1-based classes, 0 nodata)
+
+    Returns:
+        output_path
+    """
+    device = next(model.parameters()).device
+    transforms = Compose(custom_test_pipeline[1:])  # everything after loading
+    h_stride, w_stride = model.test_cfg.stride
+    h_crop, w_crop = model.test_cfg.crop_size
+    crop_batch_size = model.test_cfg.get('crop_batch_size', 1)
+
+    with rasterio.open(input_path) as src:
+        height, width = src.height, src.width
+        windows = model.slide_windows(height, width)
+        rows = {}
+        for y1, y2, x1, x2 in windows:
+            rows.setdefault((y1, y2), []).append((x1, x2))
+
+        meta = src.meta.copy()
+        block = h_stride if h_stride % 16 == 0 else 256
+        meta.update(count=1, dtype='uint8', nodata=0, driver='GTiff', compress='deflate',
+                    tiled=True, blockxsize=256, blockysize=block)
+
+        # logits summed over windows for input rows [base, base + h_crop)
+        logits = np.zeros((model.out_channels, h_crop, width), dtype=np.float32)
+        base = 0
+
+        with rasterio.open(output_path, 'w', **meta) as dst:
+            dst.write_colormap(1, class_colormap())
+
+            def flush(stop):
+                # rows [base, stop) are final: write them and shift the buffer
+                nonlocal base
+                n = stop - base
+                if n <= 0:
+                    return
+                out_window = rasterio.windows.Window(0, base, width, n)
+                classes = logits[:, :n].argmax(axis=0).astype(np.uint8) + 1
+                nodata = src.read_masks(window=out_window).min(axis=0) == 0
+                dst.write(np.where(nodata, 0, classes), 1, window=out_window)
+                logits[:, :-n] = logits[:, n:].copy() if n < logits.shape[1] else 0
+                logits[:, -n:] = 0
+                base = stop
+
+            for (y1, y2), cols in tqdm(rows.items(), desc=f"Rows of {Path(input_path).name}"):
+                flush(y1)
+                strip = src.read(window=rasterio.windows.Window(0, y1, width, y2 - y1))
+                for start in range(0, len(cols), crop_batch_size):
+                    group = cols[start:start + crop_batch_size]
+                    samples = [
+                        window_sample(transforms, np.ascontiguousarray(strip[:, :, x1:x2].transpose(1, 2, 0)), str(input_path))
+                        for x1, x2 in group
+                    ]
+                    crops = torch.stack([s['img'][0] for s in samples]).to(device)
+                    # uncollated: .data is the [meta] list CollectTestList built
+                    img_metas = [s['img_metas'].data[0] for s in samples]
+                    with torch.no_grad():
+                        out = model.encode_decode(crops, img_metas).cpu().numpy()
+                    for (x1, x2), crop_logits in zip(group, out):
+                        logits[:, y1 - base:y2 - base, x1:x2] += crop_logits
+            flush(height)
+
+    return output_path
+
+
+def batch_inference(images, output_dir, model, custom_test_pipeline, prefetch=4, overwrite=False, tiled=False,
+                    model_file=None):
+    """Run inference on many rasters with one loaded model.
+
+    Loading and preprocessing run in a background thread up to ``prefetch``
+    files ahead, the forward passes run in the calling thread, and outputs
+    are written by another thread, so disk I/O overlaps with the model.
+    Files whose prediction is newer than both the input and the model file
+    are skipped unless ``overwrite``.
+
+    With ``tiled``, each file is instead streamed through ``tiled_inference``
+    in turn, for rasters too large to load whole.
+
+    Args:
+        images: Input rasters
+        output_dir: Directory for ``<stem>_pred.tif`` predictions
+        model: Segmentor from ``load_model``
+        custom_test_pipeline: Test pipeline from ``load_model``
+        prefetch: Number of preprocessed files buffered ahead of the model
+        overwrite: Recompute predictions that are up to date
+        tiled: Use out-of-core tiled inference for every file
+        model_file: File the model was loaded from, which predictions must be
+                    newer than; defaults to the ONNX model of an
+                    OnnxSegmentor, otherwise the checkpoint
+
+    Returns:
+        Dict with counts of processed, skipped and failed files
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    if model_file is None:
+        model_file = model.path if isinstance(model, OnnxSegmentor) else ckpt
+    todo = [img for img in images if overwrite or not is_up_to_date(prediction_path(img, output_dir), img, model_file)]
+    stats = {'processed': 0, 'skipped': len(images) - len(todo), 'failed': 0}
+    if stats['skipped']:
+        print(f"⊘ {stats['skipped']} of {len(images)} predictions up to date")
+
+    if isinstance(model, OnnxSegmentor):
+        # raw pixels in, class map out: the session does its own preprocessing
+        def load(img):
+            with rasterio.open(img) as src:
+                return src.read()
+
+        def forward(data):
+            return [model.predict(data)]
+    else:
+        test_pipeline = build_test_pipeline(model, custom_test_pipeline)
+
+        def load(img):
+            return prepare_data(test_pipeline, str(img))
+
+        def forward(data):
+            return run_model(model, data)
+
+    if tiled:
+        if isinstance(model, OnnxSegmentor):
+            raise ValueError("Tiled inference needs the torch backend")
+        for img in todo:
+            try:
+                print(f"✓ {tiled_inference(model, custom_test_pipeline, img, prediction_path(img, output_dir))}")
+                stats['processed'] += 1
+            except Exception as e:
+                print(f"✗ {img}: {e}")
+                stats['failed'] += 1
+        return stats
+
+    loaded = queue.Queue(maxsize=prefetch)
+    done = object()
+
+    def loader():
+        for img in todo:
+            try:
+                loaded.put((img, load(img), None))
+            except Exception as e:
+                loaded.put((img, None, e))
+        loaded.put(done)
+
+    threading.Thread(target=loader, daemon=True).start()
+    st = time.time()
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        writes = []
+        while (entry := loaded.get()) is not done:
+            img, data, error = entry
+            if error is not None:
+                print(f"✗ {img}: {error}")
+                stats['failed'] += 1
+                continue
+            result = forward(data)
+            writes.append((img, writer.submit(write_prediction, img, result, prediction_path(img, output_dir))))
+
+        for img, future in writes:
+            try:
+                print(f"✓ {future.result()}")
+                stats['processed'] += 1
+            except Exception as e:
+                print(f"✗ {img}: {e}")
+                stats['failed'] += 1
+
+    elapsed = time.time() - st
+    if stats['processed']:
+        print(f"Inference on {stats['processed']} files in {elapsed:.1f} s ({elapsed / stats['processed']:.2f} s per file)")
+    return stats
 
 
 # CLI tool for inference
 
 def main():
-    parser = argparse.ArgumentParser(description="Run crop type inference on a geotiff image.")
-    parser.add_argument("input_image", help="Path to input geotiff image")
-    parser.add_argument("output_raster", help="Path to output georeferenced raster")
+    parser = argparse.ArgumentParser(description="Run crop type inference on geotiff images.")
+    parser.add_argument("input_image", help="Input geotiff, directory, glob pattern or manifest (.txt or chips_index.geojson)")
+    parser.add_argument("output_raster", help="Output raster for a single .tif input, otherwise an output directory")
+    parser.add_argument("--prefetch", type=int, default=4, help="Files preprocessed ahead of the model in batch mode")
+    parser.add_argument("--overwrite", action="store_true", help="Recompute predictions that are up to date")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch",
+                        help="Run the mmseg model (torch) or an exported model on ONNX Runtime (onnx)")
+    parser.add_argument("--onnx-model", default=ONNX_MODEL, help="ONNX model written by onnx_backend.py export")
+    parser.add_argument("--quantize", choices=["dynamic", "static"], default=None,
+                        help="INT8 CPU inference: encoder linears (dynamic), plus neck/head convs (static)")
+    parser.add_argument("--calibration", default="chip_*_merged.tif", help="Glob of rasters to calibrate static quantization")
+    parser.add_argument("--tiled", action="store_true",
+                        help="Stream windows from disk and write a class raster; for scene-sized inputs")
     args = parser.parse_args()
+    if args.backend == "onnx" and (args.tiled or args.quantize):
+        parser.error("--tiled and --quantize need the torch backend")
+
+    if args.backend == "onnx":
+        model, custom_test_pipeline = OnnxSegmentor(args.onnx_model), None
+    else:
+        calibration = sorted(glob.glob(args.calibration)) if args.quantize == "static" else None
+        model, custom_test_pipeline = load_model(quantize=args.quantize, calibration=calibration)
+
+    single = Path(args.input_image).is_file() and Path(args.input_image).suffix == ".tif"
+    if not (single and Path(args.output_raster).suffix == ".tif"):
+        images = resolve_inputs(args.input_image)
+        if not images:
+            raise ValueError(f"No rasters found for {args.input_image}")
+        model_file = args.onnx_model if args.backend == "onnx" else ckpt
+        batch_inference(images, args.output_raster, model, custom_test_pipeline, args.prefetch, args.overwrite,
+                        args.tiled, model_file)
+        return
+
+    if args.tiled:
+        tiled_inference(model, custom_test_pipeline, args.input_image, args.output_raster)
+        print(f"Output written to {args.output_raster}")
+        return
 
     # Run inference
     rgb1, rgb2, rgb3, output = inference_on_file(args.input_image, model, custom_test_pipeline)
@@ -0,0 +1,228 @@
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List
+
+from pystac import Item
+
+HASH_CHUNK_SIZE = 4 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    item_id    TEXT NOT NULL,
+    band       TEXT NOT NULL,
+    collection TEXT,
+    path       TEXT NOT NULL,
+    size       INTEGER NOT NULL,
+    sha256     TEXT NOT NULL,
+    datetime   TEXT,
+    footprint  TEXT,
+    recorded   TEXT NOT NULL,
+    window     TEXT,
+    PRIMARY KEY (item_id, band)
+)
+"""
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """SQLite record of every asset downloaded to the local store.
+
+    One row per (item id, band) holds the collection, local path, byte size,
+    SHA-256 checksum, acquisition datetime, item footprint and, for windowed
+    reads, the bbox the file was cut to. An asset only counts as present if
+    it has a row and the file on disk still has the recorded size, so a
+    truncated file is fetched again.
+
+    Args:
+        path: SQLite database file, created if missing
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(assets)")}
+        if "window" not in columns:
+            # manifests written before windowed reads were recorded
+            self._conn.execute("ALTER TABLE assets ADD COLUMN window TEXT")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(
+        self, item: Item, band: str, path: Path, sha256: str, size: int = None, window: list[float] = None
+    ):
+        """Insert or replace the row for one downloaded asset.
+
+        ``window`` is the bbox a windowed read was cut to; None for a full download.
+        """
+        size = Path(path).stat().st_size if size is None else size
+        row = (
+            item.id,
+            band,
+            item.collection_id,
+            str(path),
+            size,
+            sha256,
+            item.datetime.isoformat() if item.datetime else None,
+            json.dumps(item.geometry) if item.geometry else None,
+            datetime.now(timezone.utc).isoformat(),
+            json.dumps(list(window)) if window is not None else None,
+        )
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO assets (item_id, band, collection, path, size, sha256, datetime,"
+                " footprint, recorded, window) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            self._conn.commit()
+
+    def sizes(self) -> Dict[tuple[str, str], int]:
+        """Recorded byte size keyed by (item id, band)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT item_id, band, size FROM assets").fetchall()
+        return {(item_id, band): size for item_id, band, size in rows}
+
+    def entries(self) -> Dict[tuple[str, str], tuple[Path, int, list[float] | None]]:
+        """Recorded (path, size, window bbox or None) keyed by (item id, band)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT item_id, band, path, size, window FROM assets").fetchall()
+        return {
+            (item_id, band): (Path(path), size, json.loads(window) if window else None)
+            for item_id, band, path, size, window in rows
+        }
+
+    def missing(
+        self,
+        items: Iterable[Item],
+        band_names: Dict[str, List[str]],
+        window: list[float] = None,
+        is_windowed: Callable = None,
+    ) -> List[tuple[Item, str]]:
+        """Assets in a set of STAC results that are not present locally.
+
+        An asset is present when it has a row, its file still exists with the
+        recorded size, and it was recorded with the window wanted now:
+        ``window`` for assets where ``is_windowed(asset)`` holds (all assets
+        if it is None), and a full download otherwise. Anything else, such as
+        a deleted or truncated file, counts as missing.
+
+        Args:
+            items: STAC search results
+            band_names: Bands wanted, keyed by collection id
+            window: Bbox windowed reads are cut to, or None for full downloads
+            is_windowed: Predicate on a STAC asset telling whether it is read
+                         windowed
+
+        Returns:
+            (item, band) pairs still to download
+        """
+        recorded = self.entries()
+
+        def wanted_window(asset):
+            if window is None or (is_windowed is not None and not is_windowed(asset)):
+                return None
+            return list(window)
+
+        def present(item, band):
+            if (item.id, band) not in recorded:
+                return False
+            path, size, recorded_window = recorded[(item.id, band)]
+            return (
+                path.exists()
+                and path.stat().st_size == size
+                and recorded_window == wanted_window(item.assets[band])
+            )
+
+        return [
+            (item, band)
+            for item in items
+            for band in band_names[item.collection_id]
+            if band in item.assets and not present(item, band)
+        ]
+
+    def verify(self, check_hash: bool = True, max_workers: int = 8) -> List[dict]:
+        """Re-check every recorded asset against the file on disk.
+
+        Sizes are compared first; checksums are only computed for files whose
+        size matches. Files are checked in parallel (hashlib releases the GIL).
+
+        Args:
+            check_hash: Also recompute SHA-256 checksums
+            max_workers: Number of files checked concurrently
+
+        Returns:
+            One dict per bad asset with item_id, band, path and the problem
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item_id, band, path, size, sha256 FROM assets"
+            ).fetchall()
+
+        def check(row):
+            item_id, band, path, size, sha256 = row
+            path = Path(path)
+            problem = None
+            if not path.exists():
+                problem = "missing"
+            elif path.stat().st_size != size:
+                problem = f"size {path.stat().st_size} != {size}"
+            elif check_hash and file_sha256(path) != sha256:
+                problem = "checksum mismatch"
+            if problem:
+                return {"item_id": item_id, "band": band, "path": str(path), "problem": problem}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return [bad for bad in executor.map(check, rows) if bad]
+
+    def forget(self, item_id: str, band: str):
+        """Drop the row for one asset so the next sync fetches it again."""
+        with self._lock:
+            self._conn.execute("DELETE FROM assets WHERE item_id = ? AND band = ?", (item_id, band))
+            self._conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or verify a download manifest.")
+    parser.add_argument("manifest", help="Path to the manifest database")
+    parser.add_argument("--sizes-only", action="store_true", help="Skip checksum verification")
+    parser.add_argument("--forget-bad", action="store_true", help="Remove failing assets from the manifest")
+    parser.add_argument("--workers", type=int, default=8, help="Files checked concurrently")
+    args = parser.parse_args()
+
+    with Manifest(args.manifest) as manifest:
+        print(f"Verifying {len(manifest.sizes())} assets in {args.manifest}...")
+        bad = manifest.verify(check_hash=not args.sizes_only, max_workers=args.workers)
+        for entry in bad:
+            print(f"  ✗ {entry['item_id']} {entry['band']}: {entry['problem']}")
+            if args.forget_bad:
+                manifest.forget(entry["item_id"], entry["band"])
+        print(f"{len(bad)} bad assets")
+
+
+if __name__ == "__main__":
+    main()
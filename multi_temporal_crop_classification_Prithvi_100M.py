@@ -70,6 +70,7 @@ bands = [0, 1, 2, 3, 4, 5]
 
 tile_size = 224
 orig_nsize = 512
+crop_batch_size = 8  # sliding windows per forward pass at test time
 crop_size = (tile_size, tile_size)
 train_pipeline = [
     dict(type='LoadGeospatialImageFromFile', to_float32=True),
@@ -87,7 +88,8 @@ train_pipeline = [
 ]
 
 test_pipeline = [
-    dict(type='LoadGeospatialImageFromFile', to_float32=True),
+    # int16 chips stay int16 until TorchNormalize
+    dict(type='LoadGeospatialImageFromFile', to_float32=False),
     dict(type='ToTensor', keys=['img']),
      # to channels first
     dict(type="TorchPermute", keys=["img"], order=(2, 0, 1)),
@@ -230,5 +232,6 @@ model = dict(
         align_corners=False,
         loss_decode=loss_func),
     train_cfg=dict(),
-    test_cfg=dict(mode='slide', stride=(int(tile_size/2), int(tile_size/2)), crop_size=(tile_size, tile_size)))
+    test_cfg=dict(mode='slide', stride=(int(tile_size/2), int(tile_size/2)), crop_size=(tile_size, tile_size),
+                  crop_batch_size=crop_batch_size))
 auto_resume = False
@@ -0,0 +1,206 @@
+"""
+ONNX export of the crop-classification model and an ONNX Runtime backend.
+
+``export`` traces backbone, neck and decode head for one fixed-size window
+(``crop_size`` of the model's test config, 224) with a dynamic batch
+dimension, and stores the preprocessing and sliding-window settings in the
+model's metadata. ``OnnxSegmentor`` then reproduces the test pipeline
+(normalisation, band/frame reshape, sliding windows) in numpy around an
+ONNX Runtime session, so serving needs neither mmcv nor mmseg - only numpy,
+rasterio and onnxruntime.
+
+Usage:
+    python onnx_backend.py export crop_classification.onnx
+    python onnx_backend.py predict chip.tif prediction.tif --model crop_classification.onnx
+"""
+import argparse
+import json
+from pathlib import Path
+
+import numpy as np
+import rasterio
+
+ONNX_MODEL = "prithvi_local_repo/multi_temporal_crop_classification_Prithvi_100M.onnx"
+OPSET = 17
+
+
+def slide_windows(h_img: int, w_img: int, crop: tuple, stride: tuple) -> list[tuple]:
+    """(y1, y2, x1, x2) of every sliding window, as TemporalEncoderDecoder.slide_windows."""
+    (h_crop, w_crop), (h_stride, w_stride) = crop, stride
+    h_grids = max(h_img - h_crop + h_stride - 1, 0) // h_stride + 1
+    w_grids = max(w_img - w_crop + w_stride - 1, 0) // w_stride + 1
+    windows = []
+    for h_idx in range(h_grids):
+        for w_idx in range(w_grids):
+            y2 = min(h_idx * h_stride + h_crop, h_img)
+            x2 = min(w_idx * w_stride + w_crop, w_img)
+            windows.append((max(y2 - h_crop, 0), y2, max(x2 - w_crop, 0), x2))
+    return windows
+
+
+def export(model, output_path: Path, opset: int = OPSET) -> Path:
+    """Export a loaded segmentor's per-window forward pass to ONNX.
+
+    Args:
+        model: TemporalEncoderDecoder from ``inference.load_model``
+        output_path: ONNX file to write
+        opset: ONNX opset version
+
+    Returns:
+        output_path
+    """
+    import onnx
+    import torch
+
+    class WindowLogits(torch.nn.Module):
+        def __init__(self, segmentor):
+            super().__init__()
+            self.segmentor = segmentor
+
+        def forward(self, img):
+            return self.segmentor.encode_decode(img, [{}])
+
+    cfg = model.cfg
+    h_crop, w_crop = cfg.model.test_cfg.crop_size
+    dummy = torch.zeros((2, len(cfg.bands), cfg.num_frames, h_crop, w_crop))
+    wrapper = WindowLogits(model.cpu().eval())
+
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            dummy,
+            str(output_path),
+            input_names=["img"],
+            output_names=["logits"],
+            dynamic_axes={"img": {0: "batch"}, "logits": {0: "batch"}},
+            opset_version=opset,
+        )
+
+    onnx_model = onnx.load(str(output_path))
+    metadata = {
+        "means": cfg.img_norm_cfg["means"],
+        "stds": cfg.img_norm_cfg["stds"],
+        "bands": len(cfg.bands),
+        "num_frames": cfg.num_frames,
+        "crop_size": list(cfg.model.test_cfg.crop_size),
+        "stride": list(cfg.model.test_cfg.stride),
+        "crop_batch_size": cfg.model.test_cfg.get("crop_batch_size", 1),
+    }
+    for key, value in metadata.items():
+        entry = onnx_model.metadata_props.add()
+        entry.key, entry.value = key, json.dumps(value)
+    onnx.save(onnx_model, str(output_path))
+
+    # check the exported graph against the torch forward pass
+    sample = torch.randn(dummy.shape)
+    with torch.no_grad():
+        expected = wrapper(sample).numpy()
+    actual = OnnxSegmentor(output_path).session.run(None, {"img": sample.numpy()})[0]
+    print(f"Exported {output_path} (max abs difference to torch: {np.abs(actual - expected).max():.2e})")
+    return output_path
+
+
+class OnnxSegmentor:
+    """Sliding-window segmentation with an exported model on ONNX Runtime.
+
+    Args:
+        path: ONNX model written by ``export``
+        threads: Intra-op threads; None lets ONNX Runtime decide
+        providers: ONNX Runtime execution providers, in order of preference
+    """
+
+    def __init__(self, path: str | Path, threads: int = None, providers: tuple = ("CPUExecutionProvider",)):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = Path(path)
+        self.session = ort.InferenceSession(str(path), options, providers=list(providers))
+
+        metadata = {k: json.loads(v) for k, v in self.session.get_modelmeta().custom_metadata_map.items()}
+        self.means = np.asarray(metadata["means"], dtype=np.float32)[:, None, None]
+        self.stds = np.asarray(metadata["stds"], dtype=np.float32)[:, None, None]
+        self.bands = metadata["bands"]
+        self.num_frames = metadata["num_frames"]
+        self.crop_size = tuple(metadata["crop_size"])
+        self.stride = tuple(metadata["stride"])
+        self.crop_batch_size = metadata["crop_batch_size"]
+
+    def preprocess(self, img: np.ndarray) -> np.ndarray:
+        """Normalise a (channels, H, W) raster and reshape it to (bands, frames, H, W).
+
+        Same steps as TorchNormalize and Reshape in the test pipeline.
+        """
+        img = (img.astype(np.float32) - self.means) / self.stds
+        return img.reshape(self.bands, self.num_frames, *img.shape[-2:])
+
+    def logits(self, img: np.ndarray) -> np.ndarray:
+        """Class logits of a preprocessed image, averaged over sliding windows."""
+        h_img, w_img = img.shape[-2:]
+        h_crop, w_crop = self.crop_size
+        # the graph has a fixed window size, so pad images smaller than it
+        pad_h, pad_w = max(h_crop - h_img, 0), max(w_crop - w_img, 0)
+        if pad_h or pad_w:
+            img = np.pad(img, ((0, 0), (0, 0), (0, pad_h), (0, pad_w)))
+        height, width = img.shape[-2:]
+
+        windows = slide_windows(height, width, self.crop_size, self.stride)
+        preds, count = None, np.zeros((height, width), dtype=np.float32)
+        for start in range(0, len(windows), self.crop_batch_size):
+            group = windows[start:start + self.crop_batch_size]
+            crops = np.stack([img[..., y1:y2, x1:x2] for y1, y2, x1, x2 in group])
+            out = self.session.run(None, {"img": crops})[0]
+            if preds is None:
+                preds = np.zeros((out.shape[1], height, width), dtype=np.float32)
+            for (y1, y2, x1, x2), crop_logits in zip(group, out):
+                preds[:, y1:y2, x1:x2] += crop_logits
+                count[y1:y2, x1:x2] += 1
+        return (preds / count)[:, :h_img, :w_img]
+
+    def predict(self, img: np.ndarray) -> np.ndarray:
+        """0-based class map of a raw (channels, H, W) raster."""
+        return self.logits(self.preprocess(img)).argmax(axis=0)
+
+    def predict_file(self, path: str | Path) -> list[np.ndarray]:
+        """Class map of a raster file, in the form ``inference_segmentor`` returns."""
+        with rasterio.open(path) as src:
+            return [self.predict(src.read())]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the crop model to ONNX or run it with ONNX Runtime.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Export the checkpoint to ONNX")
+    export_parser.add_argument("output", nargs="?", default=ONNX_MODEL, help="ONNX file to write")
+    export_parser.add_argument("--opset", type=int, default=OPSET)
+
+    predict_parser = commands.add_parser("predict", help="Classify a raster with ONNX Runtime")
+    predict_parser.add_argument("input_image", help="18-band input geotiff")
+    predict_parser.add_argument("output_raster", help="Class raster to write (1-based classes, 0 nodata)")
+    predict_parser.add_argument("--model", default=ONNX_MODEL, help="ONNX model from the export command")
+    predict_parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from inference import load_model
+
+        model, _ = load_model(device="cpu")
+        export(model, Path(args.output), args.opset)
+        return
+
+    segmentor = OnnxSegmentor(args.model, threads=args.threads)
+    with rasterio.open(args.input_image) as src:
+        meta = src.meta.copy()
+        classes = segmentor.predict(src.read()).astype(np.uint8) + 1
+        classes = np.where(src.read_masks().min(axis=0) == 0, 0, classes)
+    meta.update(count=1, dtype="uint8", nodata=0, compress="deflate")
+    with rasterio.open(args.output_raster, "w", **meta) as dst:
+        dst.write(classes, 1)
+    print(f"Output written to {args.output_raster}")
+
+
+if __name__ == "__main__":
+    main()
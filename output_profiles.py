@@ -0,0 +1,68 @@
+import shutil
+from pathlib import Path
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+
+from config import OUTPUT_PROFILES, OUTPUT_PROFILE
+
+
+def cog_options(profile: dict, dtype: str) -> dict:
+    """COG driver creation options for a profile and data type.
+
+    The predictor is chosen from the data type: floating-point prediction (3)
+    for float rasters, horizontal differencing (2) for integers.
+    """
+    options = {k: v for k, v in profile.items() if k != "mask"}
+    options["predictor"] = 3 if np.issubdtype(np.dtype(dtype), np.floating) else 2
+    options["bigtiff"] = "IF_SAFER"
+    return options
+
+
+def add_nodata_mask(path: Path):
+    """Store an internal per-dataset mask derived from the nodata value.
+
+    Written block by block, so memory stays bounded by the block size.
+    """
+    with rasterio.Env(GDAL_TIFF_INTERNAL_MASK=True), rasterio.open(path, "r+") as dst:
+        if dst.nodata is None:
+            return
+        for _, window in dst.block_windows(1):
+            dst.write_mask(dst.dataset_mask(window=window), window=window)
+
+
+def finalize_raster(tmp_path: Path, path: Path, profile: str = OUTPUT_PROFILE) -> Path:
+    """Turn a freshly written GeoTIFF into its final output profile.
+
+    Processing stages write a plain GeoTIFF first (so they can write window
+    by window) and hand it here. The ``default`` profile keeps it as is;
+    COG profiles add the nodata mask and stream-copy it through GDAL's COG
+    driver, which tiles, compresses and builds internal overviews.
+
+    Args:
+        tmp_path: GeoTIFF written by a processing stage; removed afterwards
+        path: Final output path
+        profile: Key in config.OUTPUT_PROFILES
+
+    Returns:
+        The final output path
+    """
+    options = OUTPUT_PROFILES[profile]
+    if options is None:
+        shutil.move(tmp_path, path)
+        return path
+
+    if options.get("mask"):
+        add_nodata_mask(tmp_path)
+    with rasterio.open(tmp_path) as src:
+        dtype = src.dtypes[0]
+    rasterio.shutil.copy(tmp_path, path, driver="COG", **cog_options(options, dtype))
+    rasterio.shutil.delete(tmp_path)
+    return path
+
+
+def tmp_path_for(path: Path) -> Path:
+    """Scratch path next to ``path`` for the pre-profile GeoTIFF."""
+    path = Path(path)
+    return path.with_name(f".{path.stem}.tmp.tif")
@@ -1,19 +1,58 @@
+import math
+import os
+import xml.etree.ElementTree as ET
 from pathlib import Path
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import date, datetime
 
-import pandas as pd
+import numpy as np
 import geopandas as gpd
 import xarray as xr
+import rasterio
+import rasterio.transform
+import rasterio.windows
 import rioxarray
-from rioxarray.merge import merge_datasets
+from rasterio.errors import WindowError
+from rasterio.windows import Window, from_bounds
 from shapely import box
 from tqdm import tqdm
 
-from config import DATA_DIR, BBOX, HLS_CRS
+from build_cache import BuildCache, code_version
+from config import (
+    BUILD_CACHE_PATH,
+    DATA_DIR,
+    BBOX,
+    HLS_CRS,
+    INT_NODATA,
+    OUTPUT_PROFILE,
+    OUTPUT_PROFILES,
+    REFLECTANCE_SCALE,
+    STORAGE_DTYPE,
+)
+import output_profiles
+from output_profiles import finalize_raster, tmp_path_for
 
 xr.set_options(display_style="text")
 
-N_JOBS = 1
+N_JOBS = None  # worker processes; None sizes the pool from cores and memory
+MEMORY_OVERHEAD = 4  # float32 copies of the band stack held while processing
+CHUNKED = True  # stream bands block by block instead of loading whole tiles
+CHUNK_SIZE = 512  # block edge in pixels for chunked processing
+VIRTUAL_MERGE = False  # if True, merge same-day tiles into VRTs instead of new rasters
+INCREMENTAL = True  # skip outputs whose inputs, parameters and code are unchanged
+
+# numpy dtype names to GDAL data type names, for VRT band definitions
+_GDAL_TYPES = {
+    "uint8": "Byte",
+    "int8": "Int8",
+    "uint16": "UInt16",
+    "int16": "Int16",
+    "uint32": "UInt32",
+    "int32": "Int32",
+    "float32": "Float32",
+    "float64": "Float64",
+}
 
 
 def convert_bbox_crs(bbox):
@@ -29,13 +68,48 @@ def convert_bbox_crs(bbox):
     return [minx, miny, maxx, maxy]
 
 
-def bands_to_multiband_tif(image_path: Path, bbox: list[float] = None) -> xr.DataArray:
+def bbox_window(src: rasterio.DatasetReader, bbox: list[float]) -> Window:
+    """Block-aligned pixel window of a raster covering a bounding box.
+
+    The window is expanded outward to the raster's internal tile grid, so
+    every tile it touches is read in full and the eager and chunked paths
+    crop every scene to the same grid. It is then clipped to the raster.
+
+    Args:
+        src: Open raster
+        bbox: Bounding box in the raster CRS [minx, miny, maxx, maxy]
+
+    Returns:
+        Window into ``src``
+    """
+    window = from_bounds(*bbox, transform=src.transform)
+    block_rows, block_cols = src.block_shapes[0]
+    col_start = math.floor(window.col_off / block_cols) * block_cols
+    row_start = math.floor(window.row_off / block_rows) * block_rows
+    col_stop = math.ceil((window.col_off + window.width) / block_cols) * block_cols
+    row_stop = math.ceil((window.row_off + window.height) / block_rows) * block_rows
+    window = Window(col_start, row_start, col_stop - col_start, row_stop - row_start)
+    return window.intersection(Window(0, 0, src.width, src.height))
+
+
+def quantize(data: np.ndarray) -> np.ndarray:
+    """Scale reflectance in [0, 1] (NaN for nodata) to int16 with INT_NODATA."""
+    scaled = np.round(data * REFLECTANCE_SCALE)
+    return np.where(np.isfinite(scaled), scaled, INT_NODATA).astype(np.int16)
+
+
+def bands_to_multiband_tif(
+    image_path: Path, bbox: list[float] = None, dtype: str = STORAGE_DTYPE
+) -> xr.DataArray:
     """Process a single image directory containing multiple bands.
     Applies masking and scaling to each band based on attributes
     in the TIFF files, then combines them into a single DataArray.
 
         Args:
            image_path (Path): Path to the image directory.
+           bbox: Optional bounding box to clip the image [minx, miny, maxx, maxy]
+           dtype: "float32" for reflectance in [0, 1] with NaN nodata, or
+                  "int16" for reflectance x REFLECTANCE_SCALE with INT_NODATA
         Returns:
             xr.DataArray: Processed data array with bands as a dimension.
     """
@@ -44,33 +118,187 @@ def bands_to_multiband_tif(image_path: Path, bbox: list[float] = None) -> xr.Dat
 
     ds_list = []
     for band in bands:
-        _ds = rioxarray.open_rasterio(band, mask_and_scale=True, band_as_variable=True)
+        # cache=False so only the selected window is ever decoded
+        _ds = rioxarray.open_rasterio(band, mask_and_scale=True, band_as_variable=True, cache=False)
         _ds = _ds.rename({"band_1": band.stem})   # note variable name is lost when writing tif
         if bbox is not None:
-            _ds = _ds.rio.clip_box(minx=bbox[0], miny=bbox[1], maxx=bbox[2], maxy=bbox[3])
+            with rasterio.open(band) as src:
+                window = bbox_window(src, bbox)
+            _ds = _ds.rio.isel_window(window)
         ds_list.append(_ds)
 
     ds = xr.merge(ds_list, compat="override")
     ds = ds.clip(min=0, max=1)
+    if dtype == "int16":
+        ds = xr.apply_ufunc(quantize, ds, dask="parallelized", output_dtypes=[np.int16])
+        for var in ds.data_vars:
+            ds[var] = ds[var].rio.write_nodata(INT_NODATA)
     ds.coords["name"] = image_path.stem
 
     return ds
 
-def process_and_save_image(image: Path, bbox: list[float] = None) -> tuple[Path, bool]:
+def iter_blocks(window: Window, block_shape: tuple[int, int], block_size: int):
+    """Yield read windows tiling ``window`` along a source's internal tile grid.
+
+    Block edges fall on multiples of the source tile size (at least
+    ``block_size`` pixels), so each internal tile is decoded by exactly one
+    block even when the window itself is not tile aligned.
+
+    Args:
+        window: Window into the source raster
+        block_shape: (rows, cols) of the source's internal tiles
+        block_size: Minimum block edge in pixels
+
+    Yields:
+        Tuples of (window into the source, window into the output)
+    """
+    step_rows = math.ceil(block_size / block_shape[0]) * block_shape[0]
+    step_cols = math.ceil(block_size / block_shape[1]) * block_shape[1]
+    row_end = int(window.row_off + window.height)
+    col_end = int(window.col_off + window.width)
+
+    row = int(window.row_off)
+    while row < row_end:
+        row_stop = min((row // step_rows + 1) * step_rows, row_end)
+        col = int(window.col_off)
+        while col < col_end:
+            col_stop = min((col // step_cols + 1) * step_cols, col_end)
+            src_window = Window(col, row, col_stop - col, row_stop - row)
+            dst_window = Window(
+                col - int(window.col_off), row - int(window.row_off), col_stop - col, row_stop - row
+            )
+            yield src_window, dst_window
+            col = col_stop
+        row = row_stop
+
+
+def bands_to_multiband_tif_chunked(
+    image_path: Path,
+    output_path: Path,
+    bbox: list[float] = None,
+    block_size: int = CHUNK_SIZE,
+    dtype: str = STORAGE_DTYPE,
+) -> Path:
+    """Stack, mask, scale and clip bands block by block into a GeoTIFF.
+
+    Produces the same values as ``bands_to_multiband_tif`` but never holds
+    more than one block of every band in memory. Only the pixel window
+    covering ``bbox`` is read, in blocks aligned to the source tile grid, so
+    run time scales with the AOI rather than the tile. Each block is read from the
+    band files, nodata is set to NaN, the scale/offset from the file is
+    applied, values are clipped to [0, 1] and the block is written to the
+    matching window of the output.
+
+    With ``dtype="int16"`` the clipped reflectance is stored as int16 scaled
+    by REFLECTANCE_SCALE (the native HLS encoding) with INT_NODATA marking
+    nodata, half the size of float32.
+
+    Args:
+        image_path: Path to the image directory
+        output_path: Path of the multiband GeoTIFF to write
+        bbox: Optional bounding box to clip the image [minx, miny, maxx, maxy]
+        block_size: Block edge in pixels; also the output tile size
+        dtype: "float32" or "int16", see above
+
+    Returns:
+        Path of the written raster
+    """
+    bands = sorted(list(image_path.glob("B*tif")))
+    sources = [rasterio.open(band) for band in bands]
+    try:
+        first = sources[0]
+        for src in sources[1:]:
+            if (src.width, src.height, src.transform) != (first.width, first.height, first.transform):
+                raise ValueError(f"{src.name} is not on the same grid as {first.name}")
+
+        window = Window(0, 0, first.width, first.height)
+        if bbox is not None:
+            window = bbox_window(first, bbox)
+
+        profile = {
+            "driver": "GTiff",
+            "width": int(window.width),
+            "height": int(window.height),
+            "count": len(sources),
+            "dtype": dtype,
+            "crs": first.crs,
+            "transform": first.window_transform(window),
+            "nodata": INT_NODATA if dtype == "int16" else np.nan,
+            "tiled": True,
+            "blockxsize": block_size,
+            "blockysize": block_size,
+        }
+
+        with rasterio.open(output_path, "w", **profile) as dst:
+            dst.descriptions = tuple(band.stem for band in bands)
+            for src_window, block in iter_blocks(window, first.block_shapes[0], block_size):
+                for i, src in enumerate(sources, 1):
+                    data = src.read(1, window=src_window, masked=True).astype(np.float32)
+                    data = data * src.scales[0] + src.offsets[0]
+                    data = np.clip(data.filled(np.nan), 0, 1)
+                    if dtype == "int16":
+                        data = quantize(data)
+                    dst.write(data, i, window=block)
+    finally:
+        for src in sources:
+            src.close()
+
+    return output_path
+
+
+def processed_filename(image: Path) -> Path:
+    """Path of the processed raster for an image directory."""
+    return image.parent / f"{image.name}_processed.tif"
+
+
+def process_fingerprint(
+    cache: BuildCache,
+    image: Path,
+    bbox: list[float] = None,
+    chunked: bool = CHUNKED,
+    profile: str = OUTPUT_PROFILE,
+) -> str:
+    """Build fingerprint of one processed scene: band files, parameters and code."""
+    params = {
+        "bbox": bbox,
+        "chunked": chunked,
+        "block_size": CHUNK_SIZE,
+        "profile": OUTPUT_PROFILES[profile],
+        "dtype": STORAGE_DTYPE,
+    }
+    # the stage and every helper it calls, so editing a helper rebuilds too
+    stage = (bands_to_multiband_tif_chunked, iter_blocks) if chunked else (bands_to_multiband_tif,)
+    code = code_version(*stage, bbox_window, quantize, output_profiles)
+    return cache.fingerprint(sorted(image.glob("B*tif")), params, code)
+
+
+def process_and_save_image(
+    image: Path,
+    bbox: list[float] = None,
+    chunked: bool = CHUNKED,
+    profile: str = OUTPUT_PROFILE,
+) -> tuple[Path, bool]:
     """Process a single image and save the result.
 
     Args:
         image: Path to the image directory
         bbox: Optional bounding box to clip the image [minx, miny, maxx, maxy]
+        chunked: Stream the bands block by block instead of loading them whole
+        profile: Output profile name from config.OUTPUT_PROFILES
 
     Returns:
         Tuple of (output_file_path, success)
     """
 
     try:
-        ds = bands_to_multiband_tif(image, bbox=bbox)
-        file_name = image.parent / f"{image.name}_processed.tif"
-        ds.rio.to_raster(file_name)
+        file_name = processed_filename(image)
+        tmp_name = tmp_path_for(file_name)
+        if chunked:
+            bands_to_multiband_tif_chunked(image, tmp_name, bbox=bbox)
+        else:
+            ds = bands_to_multiband_tif(image, bbox=bbox)
+            ds.rio.to_raster(tmp_name)
+        finalize_raster(tmp_name, file_name, profile)
         print(f"Wrote processed bands to {file_name}")
         return file_name, True
     except Exception as e:
@@ -78,86 +306,477 @@ def process_and_save_image(image: Path, bbox: list[float] = None) -> tuple[Path,
         return image, False
 
 
-def merge_adjacent_tiles(
-    processed_tifs: list[Path], output_path: Path = DATA_DIR, bbox: list[float] = None
+def group_by_date(processed_tifs: list[Path]) -> dict[date, list[Path]]:
+    """Group processed scenes by acquisition date parsed from the file name.
+
+    Earlier merge outputs (``*_merged_processed.tif``) are left out so a rerun
+    does not merge a mosaic with its own inputs.
+    """
+    groups = defaultdict(list)
+    for tif in processed_tifs:
+        if tif.name.endswith("_merged_processed.tif"):
+            continue
+        date_as_str = tif.stem.split(".")[3].split("T")[0]
+        groups[datetime.strptime(date_as_str, "%Y%j").date()].append(tif)
+    return dict(groups)
+
+
+def merged_filename(inputs: list[Path], date: date) -> str:
+    """Output name of the mosaic of ``inputs``, with the date in YYYYDDD format."""
+    return (
+        inputs[0].name.rsplit(".", 4)[0]
+        + "."
+        + date.strftime("%Y%jT000000")
+        + ".v2.0_merged_processed.tif"
+    )
+
+
+def mosaic_grid(sources: list, bbox: list[float] = None) -> tuple:
+    """Output grid of a mosaic: union of the inputs, snapped to the first.
+
+    Args:
+        sources: Open rasters in the same CRS and resolution
+        bbox: Optional bounds to restrict the mosaic to [minx, miny, maxx, maxy]
+
+    Returns:
+        Tuple of (transform, width, height)
+    """
+    first = sources[0]
+    res_x, res_y = first.res
+    for src in sources[1:]:
+        if src.crs != first.crs or src.res != first.res:
+            raise ValueError(f"{src.name} does not share the grid of {first.name}")
+
+    left = min(src.bounds.left for src in sources)
+    bottom = min(src.bounds.bottom for src in sources)
+    right = max(src.bounds.right for src in sources)
+    top = max(src.bounds.top for src in sources)
+    if bbox is not None:
+        left, bottom = max(left, bbox[0]), max(bottom, bbox[1])
+        right, top = min(right, bbox[2]), min(top, bbox[3])
+
+    # snap the output to the first input's pixel grid
+    x0, y0 = first.transform.c, first.transform.f
+    left = x0 + math.floor((left - x0) / res_x) * res_x
+    top = y0 - math.floor((y0 - top) / res_y) * res_y
+    width = math.ceil((right - left) / res_x)
+    height = math.ceil((top - bottom) / res_y)
+    transform = rasterio.transform.from_origin(left, top, res_x, res_y)
+    return transform, width, height
+
+
+def build_vrt(inputs: list[Path], output_file: Path, bbox: list[float] = None) -> Path:
+    """Write a GDAL VRT that mosaics ``inputs`` without copying pixels.
+
+    The VRT references the input rasters by relative path, so it stays valid
+    when the data directory moves as a whole. Sources are listed last-first
+    with their nodata value, so - as in ``mosaic_windowed`` - the first input
+    with valid data wins where granules overlap. GDAL-based readers
+    (rasterio, rioxarray) open the VRT like any GeoTIFF.
+
+    Args:
+        inputs: Rasters in the same CRS and resolution, on the same pixel grid
+        output_file: Path of the VRT
+        bbox: Optional bounds to restrict the mosaic to [minx, miny, maxx, maxy]
+
+    Returns:
+        Path of the written VRT
+    """
+    sources = [rasterio.open(f) for f in inputs]
+    try:
+        first = sources[0]
+        transform, width, height = mosaic_grid(sources, bbox)
+        nodata = first.nodata if first.nodata is not None else np.nan
+        data_type = _GDAL_TYPES[first.dtypes[0]]
+
+        root = ET.Element("VRTDataset", rasterXSize=str(width), rasterYSize=str(height))
+        ET.SubElement(root, "SRS").text = first.crs.to_wkt()
+        ET.SubElement(root, "GeoTransform").text = ", ".join(str(v) for v in transform.to_gdal())
+
+        for b in range(1, first.count + 1):
+            band = ET.SubElement(root, "VRTRasterBand", dataType=data_type, band=str(b))
+            ET.SubElement(band, "NoDataValue").text = str(nodata)
+            if first.descriptions[b - 1]:
+                ET.SubElement(band, "Description").text = first.descriptions[b - 1]
+
+            for src, path in reversed(list(zip(sources, inputs))):
+                # placement of this input in the mosaic, in mosaic pixels
+                col = round((src.transform.c - transform.c) / transform.a)
+                row = round((src.transform.f - transform.f) / transform.e)
+                block_y, block_x = src.block_shapes[b - 1]
+
+                source = ET.SubElement(band, "ComplexSource")
+                ET.SubElement(source, "SourceFilename", relativeToVRT="1").text = os.path.relpath(
+                    path, output_file.parent
+                )
+                ET.SubElement(source, "SourceBand").text = str(b)
+                ET.SubElement(
+                    source,
+                    "SourceProperties",
+                    RasterXSize=str(src.width),
+                    RasterYSize=str(src.height),
+                    DataType=data_type,
+                    BlockXSize=str(block_x),
+                    BlockYSize=str(block_y),
+                )
+                ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(src.width), ySize=str(src.height))
+                ET.SubElement(source, "DstRect", xOff=str(col), yOff=str(row), xSize=str(src.width), ySize=str(src.height))
+                ET.SubElement(source, "NODATA").text = str(nodata)
+    finally:
+        for src in sources:
+            src.close()
+
+    ET.ElementTree(root).write(output_file)
+    return output_file
+
+
+def mosaic_windowed(
+    inputs: list[Path],
+    output_file: Path,
+    bbox: list[float] = None,
+    profile: str = OUTPUT_PROFILE,
+    block_size: int = CHUNK_SIZE,
 ) -> Path:
-    """Merge adjacent tiles taken on the same day into a single raster."""
+    """Mosaic rasters on a shared grid, writing one output block at a time.
 
-    # first, find duplicate dates
+    For every output block, the overlapping part of each input is read and
+    pasted where the block has no valid data yet (first input wins, as in
+    ``rioxarray.merge``). Only one block per input is in memory at a time,
+    however many granules the mosaic has.
 
-    df = pd.DataFrame(
-        index=[idir.stem for idir in processed_tifs], columns=["date", "path"]
-    )
-    for idir in processed_tifs:
-        date_as_str = idir.stem.split(".")[3].split("T")[0]
-        date = pd.to_datetime(date_as_str, format="%Y%j").date()
-        df.loc[idir.stem, "date"] = date
-        df.loc[idir.stem, "path"] = idir
-
-    duplicates = df[df["date"].duplicated(keep=False)]
-    date = duplicates.iloc[0]["date"]
-    duplicates = duplicates["path"].tolist()
-
-    print(f"Merging {[d.name for d in duplicates]} taken on {date}")
-
-    # load each in with rasterio and merge
-    ds = merge_datasets(
-        [rioxarray.open_rasterio(f, band_as_variable=True) for f in duplicates],
-        bounds=bbox,
-    )
+    Args:
+        inputs: Rasters in the same CRS and resolution, on the same pixel grid
+        output_file: Path of the mosaic
+        bbox: Optional bounds to restrict the mosaic to [minx, miny, maxx, maxy]
+        profile: Output profile name from config.OUTPUT_PROFILES
+        block_size: Output block edge in pixels
 
-    # ds = ds.rename({band:ds[band].attrs["long_name"] for band in ds})
+    Returns:
+        Path of the written mosaic
+    """
+    sources = [rasterio.open(f) for f in inputs]
+    try:
+        first = sources[0]
+        transform, width, height = mosaic_grid(sources, bbox)
+
+        nodata = first.nodata if first.nodata is not None else np.nan
+        meta = {
+            "driver": "GTiff",
+            "width": width,
+            "height": height,
+            "count": first.count,
+            "dtype": first.dtypes[0],
+            "crs": first.crs,
+            "transform": transform,
+            "nodata": nodata,
+            "tiled": True,
+            "blockxsize": block_size,
+            "blockysize": block_size,
+        }
+
+        tmp_name = tmp_path_for(output_file)
+        with rasterio.open(tmp_name, "w", **meta) as dst:
+            dst.descriptions = first.descriptions
+            for src_window, block in iter_blocks(Window(0, 0, width, height), (1, 1), block_size):
+                data = np.full((first.count, block.height, block.width), nodata, dtype=first.dtypes[0])
+                filled = np.zeros((block.height, block.width), dtype=bool)
+                block_bounds = rasterio.windows.bounds(block, transform)
+
+                for src in sources:
+                    src_win = from_bounds(*block_bounds, transform=src.transform)
+                    src_win = Window(
+                        round(src_win.col_off), round(src_win.row_off), block.width, block.height
+                    )
+                    try:
+                        overlap = src_win.intersection(Window(0, 0, src.width, src.height))
+                    except WindowError:
+                        continue
+                    # where the overlap lands inside the output block
+                    r0 = int(overlap.row_off - src_win.row_off)
+                    c0 = int(overlap.col_off - src_win.col_off)
+                    rows = slice(r0, r0 + int(overlap.height))
+                    cols = slice(c0, c0 + int(overlap.width))
+
+                    values = src.read(window=overlap)
+                    valid = src.dataset_mask(window=overlap) > 0
+                    take = valid & ~filled[rows, cols]
+                    data[:, rows, cols] = np.where(take, values, data[:, rows, cols])
+                    filled[rows, cols] |= take
+
+                dst.write(data, window=block)
+
+        finalize_raster(tmp_name, output_file, profile)
+    finally:
+        for src in sources:
+            src.close()
+
+    return output_file
 
-    # write date as string in YYYYDDD format
-    filename = (
-        duplicates[0].name.rsplit(".", 4)[0]
-        + "."
-        + date.strftime("%Y%jT000000")
-        + ".v2.0_merged_processed.tif"
+
+def merge_adjacent_tiles(
+    processed_tifs: list[Path],
+    output_path: Path = DATA_DIR,
+    bbox: list[float] = None,
+    profile: str = OUTPUT_PROFILE,
+    n_jobs: int | None = N_JOBS,
+    virtual: bool = VIRTUAL_MERGE,
+    cache: BuildCache | None = None,
+) -> list[Path]:
+    """Merge adjacent tiles taken on the same day into a single raster.
+
+    Every date with more than one processed scene is mosaicked. Dates are
+    merged in parallel across a process pool and each mosaic is written
+    window by window, so memory stays flat however many granules a date has.
+
+    With ``virtual``, a GDAL VRT referencing the processed inputs is written
+    per date instead (``*_merged_processed.vrt``). No pixels are copied, so
+    this takes milliseconds and no disk space; readers decode the granules
+    on the fly.
+
+    With a build cache, dates whose mosaic was already built from the same
+    inputs, parameters and code are skipped.
+
+    Args:
+        processed_tifs: Processed scenes
+        output_path: Directory for the merged rasters
+        bbox: Optional bounds to restrict the mosaics to [minx, miny, maxx, maxy]
+        profile: Output profile name from config.OUTPUT_PROFILES
+        n_jobs: Number of worker processes; None uses the available cores
+        virtual: Write VRT mosaics instead of materialised rasters
+        cache: Optional build cache for incremental merges
+
+    Returns:
+        Paths of the merged rasters
+    """
+    groups = {d: tifs for d, tifs in sorted(group_by_date(processed_tifs).items()) if len(tifs) > 1}
+    if not groups:
+        print("No dates with adjacent tiles to merge")
+        return []
+
+    outputs = {}
+    for date, tifs in groups.items():
+        name = merged_filename(tifs, date)
+        outputs[date] = output_path / (name.replace(".tif", ".vrt") if virtual else name)
+
+    fingerprints = {}
+    merged = []
+    if cache is not None:
+        params = {"bbox": bbox, "virtual": virtual, "profile": None if virtual else OUTPUT_PROFILES[profile]}
+        code = code_version(build_vrt) if virtual else code_version(mosaic_grid, mosaic_windowed, iter_blocks, output_profiles)
+        for date, tifs in list(groups.items()):
+            fingerprints[date] = cache.fingerprint(tifs, params, code)
+            if cache.is_fresh(outputs[date], fingerprints[date]):
+                merged.append(outputs.pop(date))
+                del groups[date]
+        if merged:
+            print(f"⊘ {len(merged)} merged dates up to date")
+        if not groups:
+            return sorted(merged)
+
+    if virtual:
+        for date, tifs in groups.items():
+            output_file = build_vrt(tifs, outputs[date], bbox)
+            print(f"Wrote virtual mosaic of {[t.name for t in tifs]} to {output_file}")
+            if cache is not None:
+                cache.record(output_file, fingerprints[date])
+            merged.append(output_file)
+        return sorted(merged)
+
+    n_jobs = n_jobs or min(available_cores(), len(groups))
+    print(f"Merging tiles for {len(groups)} dates with {n_jobs} workers...")
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = {}
+        for date, tifs in groups.items():
+            print(f"Merging {[t.name for t in tifs]} taken on {date}")
+            futures[executor.submit(mosaic_windowed, tifs, outputs[date], bbox, profile)] = date
+
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Merging dates"):
+            try:
+                output_file = future.result()
+                print(f"Wrote merged tile to {output_file}")
+                if cache is not None:
+                    cache.record(output_file, fingerprints[futures[future]])
+                merged.append(output_file)
+            except Exception as e:
+                print(f"Error merging tiles for {futures[future]}: {e}")
+
+    return sorted(merged)
+
+
+def available_memory() -> int:
+    """Bytes of memory available to new processes (MemAvailable on Linux)."""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+
+
+def available_cores() -> int:
+    """CPU cores this process may run on."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def estimate_task_memory(image: Path, bbox: list[float] = None, chunked: bool = CHUNKED) -> int:
+    """Rough peak memory in bytes for processing one image directory.
+
+    Eagerly, every band is held as float32, and merging, clipping and writing
+    make about ``MEMORY_OVERHEAD`` copies of the stack. Chunked processing
+    holds a few copies of one block, whatever the tile size.
+    """
+    if chunked:
+        return CHUNK_SIZE * CHUNK_SIZE * 4 * MEMORY_OVERHEAD
+
+    n_pixels = 0
+    for band in image.glob("B*tif"):
+        with rasterio.open(band) as src:
+            if bbox is None:
+                n_pixels += src.width * src.height
+            else:
+                try:
+                    window = bbox_window(src, bbox)
+                except WindowError:
+                    continue
+                n_pixels += int(window.width * window.height)
+    return n_pixels * 4 * MEMORY_OVERHEAD
+
+
+def process_images(
+    images: list[Path],
+    bbox: list[float] = None,
+    n_jobs: int | None = N_JOBS,
+    memory_budget: int | None = None,
+    cache: BuildCache | None = None,
+) -> int:
+    """Process image directories in parallel within a memory budget.
+
+    The worker pool is sized from the available cores and memory. A task is
+    only started while the estimated memory of all running tasks stays within
+    ``memory_budget``, so a few large tiles cannot exhaust the machine; a task
+    larger than the whole budget runs on its own. Results are reported in
+    input order as soon as every earlier image has finished.
+
+    With a build cache, images whose processed raster was already built from
+    the same band files, parameters and code are skipped, and every new
+    output is recorded once it has been written.
+
+    Args:
+        images: Image directories to process
+        bbox: Optional bounding box to clip the images [minx, miny, maxx, maxy]
+        n_jobs: Number of worker processes; None sizes the pool automatically
+        memory_budget: Bytes the running tasks may use together; defaults to
+                       80% of the available memory
+        cache: Optional build cache for incremental processing
+
+    Returns:
+        Number of images processed successfully or already up to date
+    """
+    up_to_date = 0
+    fingerprints = {}
+    if cache is not None:
+        stale = []
+        for img in images:
+            fingerprints[img] = process_fingerprint(cache, img, bbox)
+            if cache.is_fresh(processed_filename(img), fingerprints[img]):
+                up_to_date += 1
+            else:
+                stale.append(img)
+        if up_to_date:
+            print(f"⊘ {up_to_date} of {len(images)} images up to date")
+        images = stale
+        if not images:
+            return up_to_date
+
+    def finished(img, output_file, success):
+        if success and cache is not None:
+            cache.record(output_file, fingerprints[img])
+        return success
+
+    if memory_budget is None:
+        memory_budget = int(available_memory() * 0.8)
+    costs = [estimate_task_memory(img, bbox) for img in images]
+
+    if n_jobs is None:
+        typical = max(sorted(costs)[len(costs) // 2], 1) if costs else 1
+        n_jobs = max(1, min(available_cores(), memory_budget // typical, len(images)))
+
+    completed = up_to_date
+    if n_jobs == 1:
+        print(f"Processing {len(images)} images sequentially...")
+        # Process sequentially (easier for debugging)
+        for img in tqdm(images, desc="Processing images"):
+            if finished(img, *process_and_save_image(img, bbox)):
+                completed += 1
+        return completed
+
+    print(
+        f"Processing {len(images)} images with {n_jobs} workers "
+        f"within {memory_budget / 1e9:.1f} GB..."
     )
-    ds.rio.to_raster(output_path / filename)
-    print(f"Wrote merged tile to {output_path / filename}")
+    results = {}
+    next_to_report = 0
+    pending = list(range(len(images)))
+    running = {}
+    in_use = 0
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor, tqdm(
+        total=len(images), desc="Processing images"
+    ) as progress:
+        while pending or running:
+            # start tasks in order while they fit in the budget
+            while pending and len(running) < n_jobs:
+                idx = pending[0]
+                if running and in_use + costs[idx] > memory_budget:
+                    break
+                pending.pop(0)
+                future = executor.submit(process_and_save_image, images[idx], bbox)
+                running[future] = idx
+                in_use += costs[idx]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                idx = running.pop(future)
+                in_use -= costs[idx]
+                try:
+                    results[idx] = finished(images[idx], *future.result())
+                except Exception as e:
+                    print(f"Error processing {images[idx]}: {e}")
+                    results[idx] = False
+
+            # ordered progress: report the finished prefix
+            while next_to_report in results:
+                if results[next_to_report]:
+                    completed += 1
+                progress.set_postfix_str(images[next_to_report].name)
+                progress.update(1)
+                next_to_report += 1
+
+    return completed
 
 
 if __name__ == "__main__":
 
     bbox = convert_bbox_crs(BBOX)
 
-    # images = sorted(list(DATA_DIR.glob("HLS*")))
-    # if not images:
-    #     raise ValueError(f"No image folders found in {DATA_DIR}")
-
-
-    # if N_JOBS==1:
-    #     print(f"Processing {len(images)} images sequentially...")
-    #     # Process sequentially (easier for debugging)
-    #     completed = 0
-    #     for img in tqdm(images, desc="Processing images"):
-    #         _, success = process_and_save_image(img, bbox)
-    #         if success:
-    #             completed += 1
-
-    # else:
-    #     print(f"Processing {len(images)} images in parallel...")
-    #     with ProcessPoolExecutor(max_workers=N_JOBS) as executor:
-    #         # Submit all tasks
-    #         futures = {executor.submit(process_and_save_image, img): img for img in images}
-
-    #         # Process results as they complete
-    #         completed = 0
-    #         for future in tqdm(as_completed(futures), total=len(images), desc="Processing images"):
-    #             try:
-    #                 output_path, success = future.result()
-    #                 if success:
-    #                     completed += 1
-    #             except Exception as e:
-    #                 img = futures[future]
-    #                 print(f"Error processing {img}: {e}")
-
-    # print(
-    #     f"Conversion to multiband TIFFs complete: {completed} of {len(images)} images processed successfully."
-    # )
+    images = sorted(list(DATA_DIR.glob("HLS*")))
+    images = [img for img in images if img.is_dir()]
+    if not images:
+        raise ValueError(f"No image folders found in {DATA_DIR}")
+
+    cache = BuildCache(BUILD_CACHE_PATH) if INCREMENTAL else None
+    completed = process_images(images, bbox, n_jobs=N_JOBS, cache=cache)
+
+    print(
+        f"Conversion to multiband TIFFs complete: {completed} of {len(images)} images processed successfully."
+    )
 
     # now merge adjacent tiles taken on same day
     processed_images = sorted(list(DATA_DIR.glob("HLS*_processed.tif")))
-    merge_adjacent_tiles(processed_images, DATA_DIR, bbox=bbox)
+    merge_adjacent_tiles(processed_images, DATA_DIR, bbox=bbox, cache=cache)
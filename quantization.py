@@ -0,0 +1,97 @@
+"""
+INT8 quantization of the crop-classification model for CPU inference.
+
+Two opt-in levels:
+
+- ``dynamic``: the ``nn.Linear`` layers of the ViT encoder (attention and MLP
+  of every timm ``Block``) are replaced by dynamically quantized INT8
+  linears. Weights are quantized once; activations are quantized per batch,
+  so no calibration data is needed.
+- ``static``: additionally, every ``Conv2d``/``ConvTranspose2d`` of the neck
+  and decode head is statically quantized, with activation ranges observed
+  on calibration windows. Each conv is wrapped on its own so the reshapes,
+  layer norms and activations between them keep running in float.
+"""
+import copy
+import io
+
+import torch
+import torch.nn as nn
+from torch.ao.quantization import (
+    QuantWrapper,
+    convert,
+    default_qconfig,
+    get_default_qconfig,
+    prepare,
+    quantize_dynamic,
+)
+
+QUANT_MODES = ("dynamic", "static")
+QUANT_ENGINE = "fbgemm" if "fbgemm" in torch.backends.quantized.supported_engines else "qnnpack"
+
+
+def _wrap_convs(module: nn.Module):
+    """Wrap every conv below ``module`` with quant/dequant stubs and a qconfig."""
+    for name, child in module.named_children():
+        if isinstance(child, nn.ConvTranspose2d):
+            # per-channel weights are not supported for transposed convs
+            wrapped = QuantWrapper(child)
+            wrapped.qconfig = default_qconfig
+            setattr(module, name, wrapped)
+        elif isinstance(child, nn.Conv2d):
+            wrapped = QuantWrapper(child)
+            wrapped.qconfig = get_default_qconfig(QUANT_ENGINE)
+            setattr(module, name, wrapped)
+        else:
+            _wrap_convs(child)
+
+
+def calibration_crops(model, images: list[torch.Tensor]):
+    """Yield model-sized sliding-window crops of preprocessed images."""
+    for img in images:
+        img = img if img.dim() == 5 else img[None]  # (N, C, T, H, W)
+        for y1, y2, x1, x2 in model.slide_windows(*img.shape[-2:]):
+            yield img[..., y1:y2, x1:x2]
+
+
+def quantize_model(model, mode: str = "dynamic", calibration: list[torch.Tensor] = None):
+    """INT8 copy of a segmentor for CPU inference.
+
+    Args:
+        model: FP32 TemporalEncoderDecoder on the CPU
+        mode: "dynamic" (encoder linears) or "static" (also neck and head convs)
+        calibration: Preprocessed images, as produced by the test pipeline,
+                     used to observe activation ranges; required for "static"
+
+    Returns:
+        Quantized copy of the model, in eval mode; the input model is unchanged
+    """
+    if mode not in QUANT_MODES:
+        raise ValueError(f"Unknown quantization mode {mode!r}, expected one of {QUANT_MODES}")
+    if mode == "static" and not calibration:
+        raise ValueError("Static quantization needs calibration images")
+
+    torch.backends.quantized.engine = QUANT_ENGINE
+    model = copy.deepcopy(model).cpu().eval()
+    model.backbone = quantize_dynamic(model.backbone, {nn.Linear}, dtype=torch.qint8)
+
+    if mode == "static":
+        parts = [model.neck, model.decode_head]
+        for part in parts:
+            _wrap_convs(part)
+            prepare(part, inplace=True)
+        img_metas = [{}]
+        with torch.no_grad():
+            for crop in calibration_crops(model, calibration):
+                model.encode_decode(crop, img_metas)
+        for part in parts:
+            convert(part, inplace=True)
+
+    return model
+
+
+def model_size(model) -> int:
+    """Bytes of a model's serialised state dict."""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.getbuffer().nbytes
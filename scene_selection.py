@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date
+from typing import Dict, List
+
+from pystac import Item
+from shapely import box
+from shapely.geometry import shape
+from shapely.ops import unary_union
+
+# Sentinel-2 first: finer native resolution and more frequent revisits
+SENSOR_PREFERENCE = ("hls2-s30", "hls2-l30")
+
+
+def _cloud_cover(item: Item) -> float:
+    return item.properties.get("eo:cloud_cover", 100.0)
+
+
+def greedy_cover(items: List[Item], aoi, min_gain: float = 0.01) -> tuple[List[Item], float]:
+    """Pick a small set of items whose footprints cover an area of interest.
+
+    Greedy set cover: repeatedly take the item that adds the most uncovered
+    AOI area, breaking ties on cloud cover, until the AOI is covered or no
+    item adds more than ``min_gain`` of it. Overlapping granules that add
+    nothing (e.g. the same acquisition on a neighbouring MGRS tile) are
+    dropped.
+
+    Args:
+        items: Candidate items
+        aoi: Shapely geometry to cover, in the items' CRS (EPSG:4326)
+        min_gain: Smallest fraction of the AOI an item must add to be kept
+
+    Returns:
+        Tuple of (selected items, covered fraction of the AOI)
+    """
+    footprints = {item.id: shape(item.geometry).intersection(aoi) for item in items}
+    remaining = list(items)
+    selected = []
+    covered = None
+
+    while remaining:
+        def gain(item):
+            footprint = footprints[item.id]
+            new = footprint if covered is None else footprint.difference(covered)
+            return new.area
+
+        best = max(remaining, key=lambda item: (gain(item), -_cloud_cover(item)))
+        if gain(best) <= min_gain * aoi.area:
+            break
+        selected.append(best)
+        remaining.remove(best)
+        covered = footprints[best.id] if covered is None else unary_union([covered, footprints[best.id]])
+        if covered.area >= aoi.area * (1 - 1e-6):
+            break
+
+    fraction = covered.area / aoi.area if covered is not None else 0.0
+    return selected, fraction
+
+
+def select_scenes(
+    items: List[Item],
+    bbox: list[float],
+    dates: List[date] | None = None,
+    max_days: int = 8,
+    sensor_preference: tuple[str, ...] = SENSOR_PREFERENCE,
+    min_gain: float = 0.01,
+) -> List[Item]:
+    """Choose the fewest granules that cover a bounding box per time step.
+
+    Items are grouped by acquisition date. For each date one sensor is used:
+    the one whose granules cover the most of the bbox, with ties going to the
+    earlier entry in ``sensor_preference``. Within that sensor a greedy set
+    cover keeps only the granules needed to cover the bbox.
+
+    If ``dates`` is given, only one acquisition date is kept per requested
+    time step: the best-covered date within ``max_days`` of it, closest first
+    on ties.
+
+    Args:
+        items: STAC items from all collections
+        bbox: Bounding box in EPSG:4326 [minx, miny, maxx, maxy]
+        dates: Optional requested time steps
+        max_days: Largest allowed distance between a time step and the date
+                  chosen for it
+        sensor_preference: Collection ids in order of preference
+        min_gain: Smallest fraction of the bbox a granule must add to be kept
+
+    Returns:
+        Selected items, ordered by date
+    """
+    aoi = box(*bbox)
+
+    by_date = defaultdict(lambda: defaultdict(list))
+    for item in items:
+        by_date[item.datetime.date()][item.collection_id].append(item)
+
+    def rank(collection):
+        return sensor_preference.index(collection) if collection in sensor_preference else len(sensor_preference)
+
+    # best single-sensor cover for every acquisition date
+    covers: Dict[date, tuple[List[Item], float]] = {}
+    for day, by_sensor in by_date.items():
+        options = [
+            (greedy_cover(sensor_items, aoi, min_gain), rank(collection))
+            for collection, sensor_items in by_sensor.items()
+        ]
+        (selected, fraction), _ = max(options, key=lambda o: (round(o[0][1], 4), -o[1]))
+        covers[day] = (selected, fraction)
+
+    if dates is None:
+        chosen_days = sorted(covers)
+    else:
+        chosen_days = []
+        for target in dates:
+            candidates = [d for d in covers if abs((d - target).days) <= max_days and d not in chosen_days]
+            if not candidates:
+                print(f"  ⊘ No acquisition within {max_days} days of {target}")
+                continue
+            chosen_days.append(
+                max(candidates, key=lambda d: (round(covers[d][1], 4), -abs((d - target).days)))
+            )
+        chosen_days = sorted(chosen_days)
+
+    selected = []
+    for day in chosen_days:
+        day_items, fraction = covers[day]
+        print(f"  {day}: {[i.id for i in day_items]} cover {fraction:.0%} of the bbox")
+        selected.extend(day_items)
+
+    print(f"  Selected {len(selected)} of {len(items)} granules")
+    return selected
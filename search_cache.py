@@ -0,0 +1,225 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterator, List
+from urllib.parse import urlparse, urlunparse
+
+from pystac import Item
+from pystac_client import Client
+
+
+def cache_key(
+    collection: str,
+    bbox: list[float],
+    datetime: str | None,
+    max_cloud_cover: float | None,
+) -> str:
+    """Stable identifier for a search query."""
+    query = {
+        "collection": collection,
+        "bbox": [round(float(v), 8) for v in bbox],
+        "datetime": datetime,
+        "max_cloud_cover": max_cloud_cover,
+    }
+    return hashlib.sha1(json.dumps(query, sort_keys=True).encode()).hexdigest()
+
+
+def _strip_signature(item_dict: dict) -> dict:
+    """Drop query strings (e.g. SAS tokens) from asset hrefs.
+
+    Signed URLs expire, so items are cached unsigned and signed again on load.
+    """
+    for asset in item_dict.get("assets", {}).values():
+        asset["href"] = urlunparse(urlparse(asset["href"])._replace(query=""))
+    return item_dict
+
+
+def _incremental_datetime(datetime: str | None, latest: str | None) -> str | None:
+    """Restrict a datetime query to items at or after ``latest``.
+
+    With no ``latest`` (the cached search found nothing), the original query
+    is returned so it is re-run in full.
+    """
+    if latest is None:
+        return datetime
+    if datetime is None:
+        return f"{latest}/.."
+    start, _, end = datetime.partition("/")
+    if start in ("", "..") or start < latest:
+        start = latest
+    return f"{start}/{end or '..'}"
+
+
+def iter_search(
+    catalog: Client,
+    collection: str,
+    bbox: list[float],
+    datetime: str | None = None,
+    max_cloud_cover: float | None = None,
+    cache_dir: str | Path = ".stac_cache",
+    ttl: float = 6 * 3600,
+    modifier: Callable[[Item], Item] | None = None,
+) -> Iterator[Item]:
+    """Search a STAC collection, reusing results cached on disk.
+
+    Results are stored as JSON keyed by (collection, bbox, datetime range,
+    cloud-cover filter). A cache entry younger than ``ttl`` is returned as is.
+    An older entry is refreshed incrementally: cached items are yielded first,
+    then only items at or after the newest cached datetime are requested from
+    the catalog. Items are yielded as each result page arrives, and the cache
+    file is rewritten once the search is exhausted.
+
+    Args:
+        catalog: Open STAC client
+        collection: Collection to search (e.g. 'hls2-s30')
+        bbox: Bounding box in EPSG:4326 [minx, miny, maxx, maxy]
+        datetime: Optional STAC datetime or interval (e.g. '2023-05-01/2023-09-30')
+        max_cloud_cover: Optional maximum eo:cloud_cover in percent
+        cache_dir: Directory holding the cache files
+        ttl: Seconds before a cache entry is refreshed
+        modifier: Optional callable applied to each returned item, e.g.
+                  planetary_computer.sign_inplace
+
+    Yields:
+        STAC items matching the query
+    """
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cache_file = cache_dir / f"{cache_key(collection, bbox, datetime, max_cloud_cover)}.json"
+
+    def load(item_dict):
+        item = Item.from_dict(item_dict)
+        if modifier is not None:
+            modifier(item)
+        return item
+
+    entry = None
+    if cache_file.exists():
+        with open(cache_file) as f:
+            entry = json.load(f)
+
+    if entry is not None and time.time() - entry["refreshed"] <= ttl:
+        print(f"    Using cached search results for {collection}")
+        for item_dict in entry["items"].values():
+            yield load(item_dict)
+        return
+
+    search_kwargs = {"collections": collection, "bbox": bbox}
+    if max_cloud_cover is not None:
+        search_kwargs["query"] = {"eo:cloud_cover": {"lte": max_cloud_cover}}
+
+    if entry is None:
+        entry = {"items": {}, "latest": None}
+        search_kwargs["datetime"] = datetime
+    else:
+        search_kwargs["datetime"] = _incremental_datetime(datetime, entry["latest"])
+        for item_dict in entry["items"].values():
+            yield load(item_dict)
+
+    n_before = len(entry["items"])
+    for item in catalog.search(**search_kwargs).items():
+        item_dict = _strip_signature(item.to_dict(transform_hrefs=False))
+        if item.id not in entry["items"]:
+            yield load(item_dict)
+        entry["items"][item.id] = item_dict
+
+    datetimes = [i["properties"].get("datetime") for i in entry["items"].values()]
+    datetimes = [d for d in datetimes if d]
+    entry["latest"] = max(datetimes) if datetimes else entry["latest"]
+    entry["refreshed"] = time.time()
+    entry["query"] = {
+        "collection": collection,
+        "bbox": bbox,
+        "datetime": datetime,
+        "max_cloud_cover": max_cloud_cover,
+    }
+
+    tmp = cache_file.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(entry, f)
+    tmp.replace(cache_file)
+    print(f"    {len(entry['items']) - n_before} new items cached for {collection}")
+
+
+def cached_search(catalog: Client, collection: str, bbox: list[float], **kwargs) -> List[Item]:
+    """Search a STAC collection through the on-disk cache.
+
+    Args:
+        catalog: Open STAC client
+        collection: Collection to search (e.g. 'hls2-s30')
+        bbox: Bounding box in EPSG:4326 [minx, miny, maxx, maxy]
+        **kwargs: Passed to iter_search
+
+    Returns:
+        List of STAC items matching the query
+    """
+    return list(iter_search(catalog, collection, bbox, **kwargs))
+
+
+def stream_search(
+    catalog: Client,
+    collections: list[str],
+    bbox: list[float],
+    queue_size: int = 64,
+    **kwargs,
+) -> Iterator[Item]:
+    """Search several collections concurrently and stream the results.
+
+    Each collection is searched by its own thread, which puts items on a
+    bounded queue as result pages arrive. The caller can start downloading
+    the first items while the catalog is still paging; when the consumer
+    falls behind, the full queue pauses the searches.
+
+    Args:
+        catalog: Open STAC client
+        collections: Collections to search
+        bbox: Bounding box in EPSG:4326 [minx, miny, maxx, maxy]
+        queue_size: Maximum number of items buffered between stages
+        **kwargs: Passed to iter_search
+
+    Yields:
+        STAC items from all collections, in arrival order
+    """
+    results = queue.Queue(maxsize=queue_size)
+    done = object()
+    stop = threading.Event()
+
+    def producer(collection):
+        try:
+            for item in iter_search(catalog, collection, bbox, **kwargs):
+                if stop.is_set():
+                    return
+                results.put(item)
+        except Exception as e:
+            results.put(e)
+        finally:
+            results.put(done)
+
+    threads = [
+        threading.Thread(target=producer, args=(collection,), daemon=True)
+        for collection in collections
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        remaining = len(threads)
+        while remaining:
+            result = results.get()
+            if result is done:
+                remaining -= 1
+            elif isinstance(result, Exception):
+                raise result
+            else:
+                yield result
+    finally:
+        # unblock producers if the consumer stopped early
+        stop.set()
+        while any(thread.is_alive() for thread in threads):
+            try:
+                results.get(timeout=0.1)
+            except queue.Empty:
+                pass
@@ -0,0 +1,152 @@
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+PERCENTILES = (50, 90, 99)
+
+
+class TransferLog:
+    """Collect per-file transfer timings and per-phase durations.
+
+    Thread-safe: download workers record files concurrently while the main
+    thread times the search, signing and transfer phases. Phases are wall
+    time. Phases nested on one thread are exclusive, so signing done inside
+    the search phase is counted as signing only. Per-file transfer times go
+    into the latency percentiles, not into a phase, as concurrent transfers
+    would add up to more than the elapsed time.
+    """
+
+    def __init__(self):
+        self.files = []
+        self.phases = defaultdict(float)
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time spent inside the block, minus nested phases, to phase ``name``."""
+        stack = self._local.__dict__.setdefault("stack", [])
+        stack.append(0.0)  # seconds spent in phases nested in this one
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.phases[name] += elapsed - nested
+
+    def timed(self, name: str, fn):
+        """Wrap ``fn`` so every call is added to phase ``name``."""
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    def record(
+        self,
+        item_id: str,
+        collection: str,
+        band: str,
+        seconds: float,
+        n_bytes: int | None,
+        ok: bool = True,
+        output_bytes: int = None,
+    ):
+        """Record one file transfer.
+
+        Args:
+            item_id: STAC item id
+            collection: Collection id
+            band: Asset key
+            seconds: Transfer time
+            n_bytes: Bytes received, or None where they are not known
+                     (windowed reads through GDAL)
+            ok: Whether the transfer succeeded
+            output_bytes: Size of the file written, when it differs from the
+                          bytes received
+        """
+        with self._lock:
+            self.files.append(
+                {
+                    "item_id": item_id,
+                    "collection": collection,
+                    "band": band,
+                    "seconds": round(seconds, 4),
+                    "bytes": n_bytes,
+                    "output_bytes": output_bytes if output_bytes is not None else n_bytes,
+                    "ok": ok,
+                }
+            )
+
+    def summary(self) -> dict:
+        """Aggregate throughput, latency percentiles and phase breakdown."""
+        with self._lock:
+            files = list(self.files)
+            phases = dict(self.phases)
+
+        wall_time = time.perf_counter() - self.started
+        ok = [f for f in files if f["ok"]]
+        # throughput only counts files whose received bytes are known
+        n_bytes = sum(f["bytes"] for f in ok if f["bytes"] is not None)
+
+        groups = defaultdict(list)
+        for f in ok:
+            groups[(f["collection"], f["band"])].append(f)
+
+        latency = {}
+        for (collection, band), group in sorted(groups.items()):
+            seconds = np.array([f["seconds"] for f in group])
+            measured = [f for f in group if f["bytes"] is not None]
+            group_bytes = sum(f["bytes"] for f in measured)
+            measured_seconds = sum(f["seconds"] for f in measured)
+            latency.setdefault(collection, {})[band] = {
+                "files": len(group),
+                "bytes": group_bytes,
+                "output_bytes": sum(f["output_bytes"] for f in group),
+                **{f"p{p}_s": round(float(np.percentile(seconds, p)), 4) for p in PERCENTILES},
+                "mean_mb_per_s": round(group_bytes / 1e6 / measured_seconds, 3) if measured_seconds else None,
+            }
+
+        return {
+            "files": len(ok),
+            "failed_files": len(files) - len(ok),
+            "bytes": n_bytes,
+            "wall_time_s": round(wall_time, 3),
+            "effective_mb_per_s": round(n_bytes / 1e6 / wall_time, 3) if wall_time else None,
+            "phases_s": {name: round(seconds, 3) for name, seconds in phases.items()},
+            "latency": latency,
+        }
+
+    def write(self, output_dir: str | Path, stats: dict = None) -> Path:
+        """Write the summary and per-file records as JSON.
+
+        Args:
+            output_dir: Directory the report is written to
+            stats: Optional download statistics to include
+
+        Returns:
+            Path to the report
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        now = datetime.now(timezone.utc)
+        report = {
+            "created": now.isoformat(),
+            "stats": stats,
+            "summary": self.summary(),
+            "files": self.files,
+        }
+        path = output_dir / f"download_report_{now.strftime('%Y%m%dT%H%M%S')}.json"
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+        return path
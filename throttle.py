@@ -0,0 +1,312 @@
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from rasterio.errors import RasterioIOError
+
+# HTTP statuses that mean "slow down" rather than "this request is wrong"
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+# GDAL reports failed /vsicurl requests as e.g. "HTTP response code: 503"
+GDAL_HTTP_STATUS = re.compile(r"HTTP (?:response|error) code\s*:\s*(\d{3})")
+# GDAL errors without a status that are still worth retrying
+GDAL_TRANSIENT = re.compile(r"CURL error|timed out|Connection (?:reset|refused|closed)", re.IGNORECASE)
+
+
+class IncompleteTransfer(IOError):
+    """A transfer ended before the expected number of bytes arrived."""
+
+
+class TokenBucket:
+    """Token-bucket rate limiter shared by all download threads.
+
+    Args:
+        rate: Tokens added per second (sustained transfers started per second)
+        capacity: Maximum tokens held, i.e. the allowed burst size
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for ``seconds`` (e.g. on Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Block until a token is available and take it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+
+class AdaptiveLimiter:
+    """Concurrency limit that adapts to throttling (AIMD).
+
+    The limit grows by one after a full limit's worth of consecutive successes
+    and is halved when a request is throttled (429 or 5xx), at most once per
+    ``cooldown`` seconds so a burst of failures from one overload event only
+    counts once.
+
+    Args:
+        initial: Starting concurrency
+        minimum: Lowest concurrency the limit may fall to
+        maximum: Highest concurrency the limit may grow to
+        cooldown: Seconds between successive decreases
+    """
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = None, cooldown: float = 1.0):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum if maximum is not None else initial
+        self.cooldown = cooldown
+        self._active = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    def __enter__(self):
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def record(self, throttled: bool):
+        """Feed back the outcome of one request."""
+        with self._cond:
+            if throttled:
+                now = time.monotonic()
+                self._successes = 0
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self._last_decrease = now
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+                    self._cond.notify_all()
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, honouring Retry-After.
+
+    Args:
+        max_attempts: Total attempts per task, including the first
+        base_delay: Backoff for the first retry in seconds
+        max_delay: Upper bound on any single backoff in seconds
+    """
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """Seconds to wait before retry number ``attempt`` (0-based)."""
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Retry-After header as seconds; accepts delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def http_status(error: Exception) -> int | None:
+    """HTTP status behind a failed request, from requests or from a GDAL message."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code
+    if isinstance(error, RasterioIOError):
+        match = GDAL_HTTP_STATUS.search(str(error))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def classify(error: Exception) -> tuple[bool, bool, float | None]:
+    """Decide how to handle a failed transfer.
+
+    HTTP errors, including those GDAL reports for windowed reads, are
+    classified by status: 429 and 5xx are throttling, any other status is
+    final. Without a status, only dropped connections, timeouts and short
+    reads are retried; local errors such as a full disk or a permission
+    problem are not.
+
+    Returns:
+        Tuple of (retryable, throttled, retry_after seconds)
+    """
+    status = http_status(error)
+    if status is not None:
+        if status in THROTTLE_STATUSES:
+            response = getattr(error, "response", None)
+            retry_after = parse_retry_after(response.headers.get("retry-after")) if response is not None else None
+            return True, True, retry_after
+        return False, False, None
+    if isinstance(
+        error,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            ConnectionError,
+            TimeoutError,
+            IncompleteTransfer,
+        ),
+    ):
+        # dropped connections and short reads resume from the .part file
+        return True, False, None
+    if isinstance(error, RasterioIOError) and GDAL_TRANSIENT.search(str(error)):
+        return True, False, None
+    return False, False, None
+
+
+class _Task:
+    def __init__(self, fn, args, future):
+        self.fn = fn
+        self.args = args
+        self.future = future
+        self.attempt = 0
+
+
+class DownloadScheduler:
+    """Run transfers on a thread pool with rate limiting and retries.
+
+    Every attempt takes a token from a shared bucket and a slot from an
+    adaptive concurrency limiter. Failed attempts that look transient (429,
+    5xx, dropped connections) go onto a retry queue and are resubmitted after
+    an exponential backoff with jitter, or after the server's Retry-After. A
+    Retry-After also pauses the token bucket so other workers back off too.
+
+    Args:
+        max_workers: Thread pool size and the ceiling for adaptive concurrency
+        rate: Sustained transfers started per second, or None for no rate
+              limit. Each attempt takes one token, however many range
+              requests a windowed read makes.
+        burst: Token-bucket capacity; defaults to ``rate``
+        retry: Retry policy
+        min_workers: Floor for adaptive concurrency
+    """
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        rate: float | None = None,
+        burst: float | None = None,
+        retry: RetryPolicy = None,
+        min_workers: int = 1,
+    ):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.limiter = AdaptiveLimiter(max_workers, minimum=min_workers, maximum=max_workers)
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.retries = 0
+        self.throttled = 0
+        self._counts_lock = threading.Lock()
+
+        self._queue = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, fn, *args) -> Future:
+        """Schedule ``fn(*args)``; the returned future resolves after retries."""
+        task = _Task(fn, args, Future())
+        self.executor.submit(self._attempt, task)
+        return task.future
+
+    def _attempt(self, task: _Task):
+        with self.limiter:
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                result = task.fn(*task.args)
+            except Exception as e:
+                retryable, throttled, retry_after = classify(e)
+                self.limiter.record(throttled)
+                if throttled:
+                    with self._counts_lock:
+                        self.throttled += 1
+                    if retry_after and self.bucket is not None:
+                        self.bucket.pause(retry_after)
+                if retryable and task.attempt + 1 < self.retry.max_attempts:
+                    delay = self.retry.delay(task.attempt, retry_after)
+                    task.attempt += 1
+                    with self._counts_lock:
+                        self.retries += 1
+                    self._schedule(task, delay)
+                else:
+                    task.future.set_exception(e)
+                return
+            self.limiter.record(False)
+            task.future.set_result(result)
+
+    def _schedule(self, task: _Task, delay: float):
+        with self._cond:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), task))
+            self._cond.notify()
+
+    def _dispatch(self):
+        """Move tasks from the retry queue back onto the pool when due."""
+        with self._cond:
+            while not self._closed:
+                if not self._queue:
+                    self._cond.wait()
+                    continue
+                ready_at, _, task = self._queue[0]
+                now = time.monotonic()
+                if ready_at > now:
+                    self._cond.wait(ready_at - now)
+                    continue
+                heapq.heappop(self._queue)
+                self.executor.submit(self._attempt, task)
+
+    def shutdown(self):
+        """Stop the dispatcher and wait for running attempts to finish."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._dispatcher.join()
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()